@@ -0,0 +1,39 @@
+"""
+Measures the memory used by model objects, not counting their data.
+
+    PYTHONPATH=. python benchmarks/object_memory.py [count]
+
+"""
+from __future__ import print_function
+
+import sys
+import tracemalloc
+
+from popolo_data.importer import Popolo
+
+
+def membership_records(count):
+    return [{"person_id": "person/{0}".format(i % 1000),
+             "organization_id": "org/{0}".format(i % 10),
+             "legislative_period_id": "term/{0}".format(i % 5),
+             "start_date": "2015-01-01"}
+            for i in range(count)]
+
+
+def main(count):
+    popolo = Popolo.adopt({"memberships": membership_records(count)})
+    memberships = popolo.memberships
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for m in memberships:
+        m.id
+        m.start_date
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    print("{0} Membership objects: {1:.0f} bytes per object".format(
+        count, float(used) / count))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -4,7 +4,12 @@ from approx_dates.models import ApproxDate
 import calendar
 import six
 import json
+import weakref
 from copy import deepcopy
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 def approx_date_to_iso(approx_date):
     #duplicated here until approx_date package updated
@@ -27,7 +32,26 @@ def approx_date_to_iso(approx_date):
 
     return "{0} to {1}".format(ed.isoformat(),ld.isoformat())
 
+# parsed ApproxDates shared across the process, keyed by the raw string.
+# The ApproxDates handed out are shared, so shouldn't be modified.
+APPROX_DATE_CACHE_SIZE = 50000
+_approx_date_cache = {}
+
 def approx_date_getter(iso8601_date_string):
+    """
+    returns the (cached) ApproxDate for an iso string or range
+    """
+    try:
+        return _approx_date_cache[iso8601_date_string]
+    except KeyError:
+        pass
+    parsed = parse_approx_date(iso8601_date_string)
+    if len(_approx_date_cache) >= APPROX_DATE_CACHE_SIZE:
+        del _approx_date_cache[next(iter(_approx_date_cache))]
+    _approx_date_cache[iso8601_date_string] = parsed
+    return parsed
+
+def parse_approx_date(iso8601_date_string):
     #duplicated here until approx_date package updated
         if " to " in iso8601_date_string: #extract double date
             start,end = iso8601_date_string.split(" to ")
@@ -41,6 +65,41 @@ def approx_date_getter(iso8601_date_string):
             return ApproxDate.from_iso8601(iso8601_date_string)  
 
 
+IMMUTABLE_TYPES = (type(None), bool, int, float, six.text_type,
+                   six.binary_type, ApproxDate, date) + six.integer_types
+
+def default_factory(default):
+    """
+    returns a function giving a fresh copy of default.
+    
+    Immutable values are shared, empty containers are made new, and
+    anything else is deep copied.
+    """
+    if isinstance(default, IMMUTABLE_TYPES):
+        return lambda: default
+    if type(default) in (list, dict) and not default:
+        return type(default)
+    return lambda: deepcopy(default)
+
+
+def count_values(value):
+    """
+    number of non-empty values in value, looking inside dicts and lists
+    """
+    if isinstance(value, Mapping):
+        return sum(count_values(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(count_values(v) for v in value)
+    if value is None or value == "":
+        return 0
+    return 1
+
+
+# related lists (identifiers, links, ...) this short are scanned for a
+# type rather than grouped - the grouping only pays for longer lists
+RELATED_SCAN_LIMIT = 8
+
+
 def first(l):
     '''Return the first item of a list, or None if it's empty'''
     return l[0] if l else None
@@ -69,27 +128,40 @@ class Attribute(object):
     '''
     def __init__(self,attr="",default=None,null=False,allow_multiple=False):
         self.attr = attr
-        self._default_value = default
         self.allow_null_default = null
         self.allow_multiple = allow_multiple
+        self.set_default(default)
+
+    def set_default(self, default):
+        self._default_value = default
+        self.default_factory = default_factory(default)
+        self.store_default = not (self.allow_null_default == False
+                                  and default is None)
 
     @property
     def default_value(self):
         """
         safe guard against default being shared between instances
         """
-        return deepcopy(self._default_value)
+        return self.default_factory()
     
     def __get__(self, obj, type=None):
-        if self.allow_null_default == False and self.default_value == None:
-            return obj.data.get(self.attr)
+        if not self.store_default:
+            result = obj.data.get(self.attr)
         else:
             try:
                 result = obj.data[self.attr]
             except KeyError:
-                result = self.default_value
+                if obj._shared:
+                    obj.own_data()
+                result = self.default_factory()
                 obj.data[self.attr] = result
-            return result
+                return result
+        if obj._shared and isinstance(result, (list, dict)):
+            #caller may change it in place
+            obj.own_data()
+            result = obj.data[self.attr]
+        return result
 
     def __set__(self,obj,value):
         if six.PY2 and isinstance(value,str):
@@ -97,7 +169,10 @@ class Attribute(object):
         else:
             nv = value
         
+        if obj._shared:
+            obj.own_data()
         obj.data[self.attr] = nv
+        obj.data_changed(self.attr)
 
 class RelatedAttribute(Attribute):
     """
@@ -106,8 +181,8 @@ class RelatedAttribute(Attribute):
     def __init__(self,attr="",default=None,null=False,
                  id_attr=None,collection=None):
         self.attr = attr
-        self._default_value = default
         self.allow_null_default = null
+        self.set_default(default)
         self._collection = collection
             
     @property
@@ -132,10 +207,27 @@ class DateAttribute(Attribute):
     """
     Interacts with ApproxDates - sets iso, retrieves ApproxDate
     """
+    cache_slot = None #set by PopoloMeta
+    
     def __get__(self, obj, type=None):
-            return obj.get_date(self.attr,self.default_value)
+        raw = obj.data.get(self.attr)
+        if not raw:
+            return self.default_factory()
+        try:
+            cached = getattr(obj, self.cache_slot)
+        except AttributeError:
+            cached = None
+        #checked against the raw value in case data was changed directly
+        if cached is not None and cached.source_string == raw:
+            return cached
+        parsed = approx_date_getter(raw)
+        setattr(obj, self.cache_slot, parsed)
+        return parsed
     
     def __set__(self,obj,value):
+        setattr(obj, self.cache_slot, None)
+        if obj._shared:
+            obj.own_data()
         if isinstance(value,ApproxDate):
             obj.data[self.attr] = approx_date_to_iso(value)
         elif isinstance(value,datetime):
@@ -144,6 +236,7 @@ class DateAttribute(Attribute):
             obj.data[self.attr] = value.isoformat()
         else:
             obj.data[self.attr] = value
+        obj.data_changed(self.attr)
 
 
 class IdentiferAttribute(Attribute):
@@ -180,6 +273,9 @@ class PopoloMeta(type):
         """
         If attr value not specified for an attribute, gives it the name assigned.
         
+        Classes declaring __slots__ also get a slot per DateAttribute to
+        keep the parsed date in.
+        
         This specifies the key of the popolo dict the property refers to.
         
         so 
@@ -191,10 +287,17 @@ class PopoloMeta(type):
         name = Attribute(attr="name")
         """
         
+        cache_slots = []
         for k,v in six.iteritems(dct):
             if isinstance(v,Attribute) :
                 if v.attr == "":
                     v.attr = k 
+            if isinstance(v,DateAttribute):
+                #the parsed date is kept on the object
+                v.cache_slot = "_" + k + "_parsed"
+                cache_slots.append(v.cache_slot)
+        if "__slots__" in dct:
+            dct["__slots__"] = tuple(dct["__slots__"]) + tuple(cache_slots)
 
         cls = super(PopoloMeta, cls).__new__(cls, name, parents, dct)
         return cls
@@ -202,6 +305,12 @@ class PopoloMeta(type):
 
 class PopoloObject(six.with_metaclass(PopoloMeta,object)):
 
+    # model classes keep their attributes (and memoized values) in
+    # __slots__. The __dict__ slot is only filled if something else is
+    # set on an object, so ordinary objects don't carry one.
+    __slots__ = ("data", "all_popolo", "_collection", "_position",
+                 "_owners", "_shared", "_related", "_content", "__dict__")
+
     class DoesNotExist(Exception):
         pass
 
@@ -214,10 +323,73 @@ class PopoloObject(six.with_metaclass(PopoloMeta,object)):
         data.update(kwargs)
         self.data = data
         self.all_popolo = all_popolo
+        self._collection = None
+        self._position = None
+        self._owners = None
+        self._shared = False
+        self._related = None
+        self._content = None
+
+    def own_data(self):
+        """
+        data may be shared copy-on-write with another Popolo (see
+        Popolo.shared_copy) - if so, take a private copy before changing it.
+        """
+        if self._shared:
+            self.data = deepcopy(self.data)
+            self._shared = False
+
+    def data_changed(self, key):
+        """
+        called whenever a value in self.data is set through an Attribute,
+        lets the collection that holds this object keep its indexes current
+        """
+        self._content = None
+        if self._related:
+            self.forget_related_entries(key)
+        if self._collection is not None:
+            self._collection.object_changed(self, key)
+        if self._owners:
+            self.notify_owners(key)
+
+    def move_to(self, collection, position):
+        """
+        make collection, where this object is at position, the one it
+        belongs to. Any collection it was already in still hears about
+        its changes (through object_changed) while that collection
+        exists.
+        """
+        if self._collection is not None:
+            if self._owners is None:
+                self._owners = []
+            self._owners.append((weakref.ref(self._collection),
+                                 self._position))
+        self._collection = collection
+        self._position = position
+
+    def notify_owners(self, key):
+        live = []
+        for ref, position in self._owners:
+            collection = ref()
+            if collection is not None:
+                live.append((ref, position))
+                collection.object_changed(self, key)
+        self._owners = live or None
+
+    def position_in(self, collection):
+        """
+        this object's position in collection, or None if it isn't in it
+        """
+        if collection is self._collection:
+            return self._position
+        for ref, position in self._owners or ():
+            if ref() is collection:
+                return position
+        return None
 
     @property
     def json(self):
-        return json.dumps(self.data)
+        return json.dumps(dict(self.data))
 
     def get_date(self, attr, default):
         d = self.data.get(attr)
@@ -257,22 +429,79 @@ class PopoloObject(six.with_metaclass(PopoloMeta,object)):
             self.get_related_value('links', 'note', 'wikipedia', 'url')
             # => 'https://en.wikipedia.org/wiki/Dale_Cooper'
         '''
-        return [
-            o[info_value_key]
-            for o in self.get_related_object_list(popolo_array)
-            if o[info_type_key] == info_type
-            ]
+        obj_list = self.data.get(popolo_array)
+        if not obj_list:
+            return []
+        if len(obj_list) <= RELATED_SCAN_LIMIT:
+            return [o[info_value_key] for o in obj_list
+                    if o[info_type_key] == info_type]
+        entries = self.related_entries(
+            popolo_array, info_type_key).get(info_type)
+        if not entries:
+            return []
+        return [o[info_value_key] for o in entries]
+
+    def related_entries(self, popolo_array, info_type_key):
+        """
+        {type: [entries]} for the entries in popolo_array (e.g.
+        'identifiers'), grouped on info_type_key (e.g. 'scheme').
 
-    def del_related_values(self,popolo_array, info_type_key, info_type):
+        Built on first use and kept on the object - set_related_values
+        and del_related_values keep it up to date, and it is rebuilt if
+        the list is replaced or changes length. Call data_changed after
+        replacing an entry or changing its type in place.
+        
+        get_related_values only uses it for lists longer than
+        RELATED_SCAN_LIMIT.
+        """
+        obj_list = self.data.get(popolo_array)
+        if not obj_list:
+            return {}
+        related = self._related
+        if related is None:
+            related = self._related = {}
+        else:
+            cached = related.get(popolo_array)
+            if cached is not None and cached[1] is obj_list \
+                    and cached[0] == info_type_key \
+                    and cached[2] == len(obj_list):
+                return cached[3]
+        grouped = {}
+        for o in obj_list:
+            grouped.setdefault(o[info_type_key], []).append(o)
+        related[popolo_array] = (info_type_key, obj_list, len(obj_list),
+                                 grouped)
+        return grouped
+
+    def forget_related_entries(self, popolo_array):
+        self._related.pop(popolo_array, None)
+
+    def related_entries_changed(self, popolo_array, info_type_key, grouped):
+        """
+        notify the change to popolo_array, keeping the (updated)
+        grouping of its entries
+        """
+        self.data_changed(popolo_array)
         obj_list = self.get_related_object_list(popolo_array)
-        if obj_list:
+        if self._related is None:
+            self._related = {}
+        self._related[popolo_array] = (info_type_key, obj_list,
+                                       len(obj_list), grouped)
+
+    def del_related_values(self,popolo_array, info_type_key, info_type):
+        self.own_data()
+        grouped = self.related_entries(popolo_array, info_type_key)
+        entries = grouped.get(info_type)
+        if entries:
+            obj_list = self.get_related_object_list(popolo_array)
             for x,o in enumerate(obj_list):
-                if o[info_type_key] == info_type:
+                if o is entries[0]:
+                    del obj_list[x]
                     break
-            
-            if obj_list[x][info_type_key] == info_type:
-                del obj_list[x]
-            
+            del entries[0]
+            if not entries:
+                del grouped[info_type]
+            self.related_entries_changed(popolo_array, info_type_key, grouped)
 
     def set_related_values(self, popolo_array
                            , info_type_key, info_type, info_value_key,new_value):
@@ -280,15 +509,28 @@ class PopoloObject(six.with_metaclass(PopoloMeta,object)):
         allows related values to be set
         """
         
-        obj_list = self.get_related_object_list(popolo_array)
-        for o in obj_list:
-            if o[info_type_key] == info_type:
-                o[info_value_key] = new_value
-                return
+        self.own_data()
+        grouped = self.related_entries(popolo_array, info_type_key)
+        entries = grouped.get(info_type)
+        if entries:
+            entries[0][info_value_key] = new_value
+            self.related_entries_changed(popolo_array, info_type_key, grouped)
+            return
         new = {info_type_key:info_type,
                info_value_key:new_value}
+        obj_list = self.get_related_object_list(popolo_array)
         obj_list.append(new)
         self.data[popolo_array] = obj_list
+        grouped[info_type] = [new]
+        self.related_entries_changed(popolo_array, info_type_key, grouped)
+
+    def identifiers_by_scheme(self):
+        """
+        {scheme: [identifiers]} for all of this object's identifiers
+        """
+        return {scheme: [o['identifier'] for o in entries]
+                for scheme, entries
+                in self.related_entries('identifiers', 'scheme').items()}
 
     def identifier_values(self, scheme):
         return self.get_related_values(
@@ -365,27 +607,39 @@ class PopoloObject(six.with_metaclass(PopoloMeta,object)):
             return self.id != other.id
         return NotImplemented
 
+    @property
+    def information_content(self):
+        """
+        how much information is held - the number of values in data,
+        counting each value in lists and nested dicts, and not counting
+        empty ones.
+        
+        Kept until data_changed is called, so call that after changing
+        nested values in place.
+        """
+        if self._content is None:
+            self._content = count_values(self.data)
+        return self._content
+
     def __lt__(self,other):
         """
         is this less "full" than the other?
-        Based entirely on how much info is in there - len of dict.
+        Based entirely on how much info is in there - see
+        information_content.
         """
         if self.__class__ == other.__class__:
-            ours = len(self.json)
-            theirs = len(other.json)
-            return ours < theirs
+            return self.information_content < other.information_content
         else:
             return NotImplemented
         
     def __gt__(self,other):
         """
         is this more "full" than the other?
-        Based entirely on how much info is in there - len of dict.
+        Based entirely on how much info is in there - see
+        information_content.
         """        
         if self.__class__ == other.__class__:
-            ours = len(self.json)
-            theirs = len(other.json)
-            return ours > theirs
+            return self.information_content > other.information_content
         else:
             return NotImplemented
 
@@ -412,6 +666,8 @@ class PopoloObject(six.with_metaclass(PopoloMeta,object)):
 
 class CurrentMixin(object):
 
+    __slots__ = ()
+
     def current_at(self, when):
         return ApproxDate.possibly_between(
             self.start_date, when, self.end_date)
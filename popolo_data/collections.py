@@ -3,55 +3,79 @@ Classes to define the different Popolo collections
 
 """
 import json
+from array import array
+from copy import deepcopy
+from datetime import date
+from itertools import count
+try:
+    from collections.abc import Hashable, Mapping
+except ImportError:
+    from collections import Hashable, Mapping
 
-from .models import Person, Organization, Membership, Area, Post, Event
-from .base import first
+from .models import (Person, Organization, Membership, Area, Post, Event,
+    historic_name_ranges)
+from .base import (first, approx_date_getter, Attribute, DateAttribute,
+    PopoloObject)
+from .merging import CollectionMergeReport, Contest, timed
+from .indexes import (AttributeIndex, IntervalIndex, MultiValueIndex,
+    NameIndex)
 
-class PopoloCollection(object):
+class KeyLookup(Mapping):
+    """
+    key_for_hash -> object mapping for a collection, creating objects
+    only as they are looked up.
+    """
 
-    object_class = None
+    def __init__(self, collection):
+        self.collection = collection
 
-    def __init__(self, data_list , all_popolo):
-        self.all_popolo = all_popolo
-        self.object_class = self.__class__.object_class
-        self.object_list = \
-            [self.object_class(data, all_popolo) for data in data_list]
-        self.lookup_from_key = {}
-        for o in self.object_list:
-            self.lookup_from_key[o.key_for_hash] = o
+    def __getitem__(self, key):
+        collection = self.collection
+        return collection.get_object(collection.key_positions()[key])
+
+    def __iter__(self):
+        return iter(self.collection.key_positions())
 
     def __len__(self):
-        return len(self.object_list)
+        return len(self.collection.key_positions())
+
+
+class SelectionMixin(object):
+    """
+    selecting from a collection or a view of one - subclasses provide
+    matching, raw_data and a view_class to make views with.
+    """
 
     def json(self):
         return json.dumps(self.raw_data())
 
-    def raw_data(self):
-        return [x.data for x in self.object_list]
-
-    def __getitem__(self, index):
-        return self.object_list[index]
+    def filter(self, **kwargs):
+        """
+        returns a lazy view of the objects where every kwarg matches
+        """
+        return self.view_class(self, list(kwargs.items()))
 
-    @property
-    def first(self):
-        return first(self.object_list)
+    def where(self, predicate):
+        """
+        returns a lazy view of the objects for which predicate(o) is true
+        """
+        return self.view_class(self, [], [predicate])
 
-    def filter(self, **kwargs):
-        filter_list = [
-            o.data for o in self.object_list
-            if all(getattr(o, k) == v for k, v in kwargs.items())
-        ]
-        return self.__class__(filter_list, self.all_popolo)
+    def select(self, **kwargs):
+        """
+        returns a list of the objects where every kwarg matches.
+        """
+        return self.matching(list(kwargs.items()))
 
-    def append(self,new):
-        new.all_popolo = self.all_popolo
-        self.lookup_from_key[new.key_for_hash] = new
-        self.object_list.append(new)
-        
-    add = append
+    def selecting(self, selector):
+        """
+        returns a lazy view of the objects at the positions given by
+        selector(collection)
+        """
+        return self.view_class(self, [], [], [selector])
 
     def get(self, **kwargs):
-        matches = self.filter(**kwargs)
+        matches = self.select(**kwargs)
         n = len(matches)
         if n == 0:
             msg = "No {0} found matching {1}"
@@ -63,94 +87,950 @@ class PopoloCollection(object):
                 self.object_class, n, kwargs))
         return matches[0]
 
-    def merge(self,other,new_collection,unique_on="id"):
+
+class CollectionView(SelectionMixin):
+    """
+    A read-only selection from a collection, evaluated lazily.
+
+    Holds the collection it was made from plus the criteria and
+    predicates objects must satisfy - the objects themselves are the
+    collection's own, not copies. Views are re-evaluated if the
+    collection has changed since they were last read.
+    
+    Views can be filtered further, and materialize() will return an
+    independent collection holding copies of the selected objects.
+    
+    Each collection class has its own view class (its view_class),
+    which answers the collection's lookups (by_name, by_identifier,
+    ...) by asking the collection and keeping what is in the view.
+    """
+
+    def __init__(self, parent, criteria, predicates=(), selectors=()):
+        if isinstance(parent, CollectionView):
+            criteria = parent.criteria + list(criteria)
+            predicates = list(parent.predicates) + list(predicates)
+            selectors = list(parent.selectors) + list(selectors)
+            parent = parent.parent
+        self.parent = parent
+        self.all_popolo = parent.all_popolo
+        self.criteria = criteria
+        self.predicates = list(predicates)
+        self.selectors = list(selectors)
+        self._evaluated_at = None
+        self._objects = None
+        self._lookup = None
+        self._positions = None
+
+    @property
+    def object_list(self):
+        version = self.parent._version
+        if self._evaluated_at != version:
+            self._objects = self.parent.matching(self.criteria,
+                                                 self.predicates,
+                                                 self.selectors)
+            self._lookup = None
+            self._positions = None
+            self._evaluated_at = version
+        return self._objects
+
+    @property
+    def view_class(self):
+        return self.__class__
+
+    @property
+    def object_class(self):
+        return self.parent.object_class
+
+    @property
+    def lookup_from_key(self):
+        object_list = self.object_list
+        if self._lookup is None:
+            self._lookup = {o.key_for_hash: o for o in object_list}
+        return self._lookup
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    @property
+    def first(self):
+        return first(self.object_list)
+
+    def raw_data(self):
+        parent = self.parent
+        return [parent.data_at(o.position_in(parent))
+                for o in self.object_list]
+
+    def positions(self):
+        """
+        the set of positions in parent of the selected objects
+        """
+        object_list = self.object_list
+        if self._positions is None:
+            parent = self.parent
+            self._positions = set(o.position_in(parent) for o in object_list)
+        return self._positions
+
+    def restricted(self, objects):
+        """
+        those of objects (from parent) that are in the view
+        """
+        positions = self.positions()
+        parent = self.parent
+        return [o for o in objects if o.position_in(parent) in positions]
+
+    def matching(self, criteria, predicates=(), selectors=()):
+        return self.parent.matching(self.criteria + list(criteria),
+                                    self.predicates + list(predicates),
+                                    self.selectors + list(selectors))
+
+    def materialize(self):
+        """
+        returns a new collection holding copies of the selected objects
+        """
+        return self.parent.__class__(
+            [deepcopy(o.data) for o in self.object_list], self.all_popolo)
+
+    def append(self, new):
+        raise TypeError("Views are read-only, materialize() it first.")
+
+    add = append
+
+    def create_index(self, attr):
+        raise TypeError("Indexes can only be created on a collection.")
+
+
+class PopoloCollection(SelectionMixin):
+    """
+    Holds the raw records of one Popolo array.
+
+    Model objects are created from records the first time they are
+    needed, and kept. The key lookup and indexes are also built on
+    first use.
+    """
+
+    object_class = None
+    indexed_attributes = ()
+    view_class = CollectionView
+
+    def __init__(self, data_list , all_popolo):
+        self.all_popolo = all_popolo
+        self.object_class = self.__class__.object_class
+        self.records = list(data_list)
+        self.objects = [None] * len(self.records)
+        self._unmade = len(self.records)
+        self.shared = False
+        self.indexes = {}
+        self._key_positions = None
+        self._position_keys = None
+        self._raw_keys = {}
+        self._version = 0
+        for attr in self.__class__.indexed_attributes:
+            self.create_index(attr)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def data_at(self, position):
+        o = self.objects[position]
+        if o is None:
+            return self.record(position)
+        return o.data
+
+    def record(self, position):
+        """
+        the raw record at position
+        """
+        return self.records[position]
+
+    def add_record(self, data):
+        """
+        store a new raw record, returning its position
+        """
+        self.records.append(data)
+        return len(self.records) - 1
+
+    def raw_data(self):
+        return [self.data_at(p) for p in range(len(self.objects))]
+
+    def get_object(self, position):
+        o = self.objects[position]
+        if o is None:
+            o = self.object_class(self.record(position), self.all_popolo)
+            o._collection = self
+            o._position = position
+            o._shared = self.shared
+            self.objects[position] = o
+            self._unmade -= 1
+        return o
+
+    @property
+    def object_list(self):
+        """
+        all objects - creating any that haven't been yet
+        """
+        if self._unmade:
+            for position in range(len(self.objects)):
+                self.get_object(position)
+        return self.objects
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_object(p)
+                    for p in range(*index.indices(len(self.objects)))]
+        if index < 0:
+            index += len(self.objects)
+        if not 0 <= index < len(self.objects):
+            raise IndexError("collection index out of range")
+        return self.get_object(index)
+
+    def __iter__(self):
+        for position in range(len(self.objects)):
+            yield self.get_object(position)
+
+    @property
+    def first(self):
+        if self.objects:
+            return self.get_object(0)
+        return None
+
+    @property
+    def lookup_from_key(self):
+        return KeyLookup(self)
+
+    def key_positions(self):
+        """
+        key_for_hash -> position, built on first use
+        """
+        if self._key_positions is None:
+            values = self.values_of(self.key_attr())
+            self._key_positions = {v: p for p, v in values}
+            self._position_keys = dict(values)
+        return self._key_positions
+
+    def position_of(self, obj):
+        """
+        the position of obj, one of this collection's objects - an object
+        can be in more than one collection (see PopoloObject.move_to)
+        """
+        return obj.position_in(self)
+
+    def update_key(self, position):
+        """
+        move the object at position to its current key in the key lookup
+        """
+        old = self._position_keys.get(position)
+        new = self.value_at(position, self.key_attr())
+        if old == new:
+            return
+        if self._key_positions.get(old) == position:
+            del self._key_positions[old]
+        self._key_positions[new] = position
+        self._position_keys[position] = new
+
+    def id_attributes(self):
+        """
+        names of the attributes holding ids of other objects (e.g.
+        person_id) - plain Attributes with '_id' in their name, including
+        those inherited.
+        """
+        names = set()
+        for klass in self.object_class.__mro__:
+            for name, descriptor in klass.__dict__.items():
+                if "_id" in name and type(descriptor) is Attribute:
+                    names.add(name)
+        return sorted(names)
+
+    def remap_ids(self, remap):
+        """
+        replace ids of other objects (see id_attributes) with
+        remap[old_id]. Only the objects holding an old id are changed -
+        found through an index on the attribute if there is one.
+        """
+        for attr in self.id_attributes():
+            index = self.built_index(attr)
+            if index is not None:
+                if len(remap) < len(index.buckets):
+                    olds = [old for old in remap if old in index.buckets]
+                else:
+                    olds = [old for old in index.buckets if old in remap]
+                positions = sorted(set(p for old in olds
+                                       for p in index.buckets[old]))
+            else:
+                positions = [p for p, value in self.values_of(attr)
+                             if isinstance(value, Hashable)
+                             and value in remap]
+            for position in positions:
+                o = self.get_object(position)
+                value = getattr(o, attr)
+                if isinstance(value, Hashable) and value in remap:
+                    setattr(o, attr, remap[value])
+
+    def raw_key(self, attr):
+        """
+        if attr reads straight from a record (a plain Attribute), the
+        record key it reads. Otherwise None.
+        """
+        try:
+            return self._raw_keys[attr]
+        except KeyError:
+            pass
+        key = None
+        for klass in self.object_class.__mro__:
+            if attr in klass.__dict__:
+                descriptor = klass.__dict__[attr]
+                if type(descriptor) is Attribute \
+                        and not descriptor.store_default:
+                    key = descriptor.attr
+                break
+        self._raw_keys[attr] = key
+        return key
+
+    def values_of(self, attr):
+        """
+        (position, value) for attr for every record - read straight from
+        records without creating objects where possible
+        """
+        key = self.raw_key(attr)
+        positions = range(len(self.objects))
+        if key is None:
+            return [(p, getattr(self.get_object(p), attr)) for p in positions]
+        data_at = self.data_at
+        return [(p, data_at(p).get(key)) for p in positions]
+
+    def value_at(self, position, attr):
+        key = self.raw_key(attr)
+        if key is None:
+            return getattr(self.get_object(position), attr)
+        return self.data_at(position).get(key)
+
+    def key_attr(self):
+        """
+        the attribute key_for_hash gives the value of
+        """
+        if self.object_class.key_for_hash is PopoloObject.key_for_hash:
+            return "id"
+        return "key_for_hash"
+
+    def selected_positions(self, selectors, candidates=None):
+        """
+        narrows candidates (all positions if None) to the positions
+        every selector returns. None if there are no selectors.
+        """
+        for selector in selectors:
+            positions = selector(self)
+            if candidates is None:
+                candidates = positions
+            else:
+                positions = set(positions)
+                candidates = [p for p in candidates if p in positions]
+        return candidates
+
+    def matching(self, criteria, predicates=(), selectors=()):
+        """
+        objects matching every (attr, value) pair in criteria and
+        every predicate, at the positions chosen by every selector.
+
+        If any of the criteria are indexed, only the objects in the
+        smallest matching index bucket are checked.
+        """
+        candidates = None
+        for k, v in criteria:
+            index = self.built_index(k)
+            if index is None:
+                continue
+            positions = index.lookup(v)
+            if positions is None:
+                continue
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+        candidates = self.selected_positions(selectors, candidates)
+        if candidates is None:
+            objects = self.object_list
+        else:
+            get_object = self.get_object
+            objects = [get_object(p) for p in candidates]
+        return [o for o in objects
+                if all(getattr(o, k) == v for k, v in criteria)
+                and all(p(o) for p in predicates)]
+
+    def create_index(self, attr):
+        """
+        maintain an index of the values of attr - filter and get will use
+        it for equality lookups on attr. It is built on first use.
+        """
+        data_key = None
+        for klass in self.object_class.__mro__:
+            if attr in klass.__dict__:
+                descriptor = klass.__dict__[attr]
+                if type(descriptor) in (Attribute, DateAttribute):
+                    data_key = descriptor.attr
+                break
+        index = AttributeIndex(attr, data_key)
+        self.indexes[attr] = index
+        return index
+
+    def built_index(self, attr):
+        """
+        the index on attr (None if there isn't one), built if needed
+        """
+        index = self.indexes.get(attr)
+        if index is not None and not index.built:
+            for position, value in self.values_of(attr):
+                index.add(position, value)
+            index.built = True
+        return index
+
+    def append(self,new):
+        new.all_popolo = self.all_popolo
+        new.move_to(self, self.add_record(new.data))
+        self.objects.append(new)
+        self.added(new._position)
+        
+    add = append
+
+    def append_data(self, data):
+        """
+        add a raw record, without creating its object
+        """
+        position = self.add_record(data)
+        self.objects.append(None)
+        self._unmade += 1
+        self.added(position)
+
+    def added(self, position):
+        """
+        record a new position in the key lookup and any built indexes
+        """
+        self._version += 1
+        if self._key_positions is not None:
+            key = self.value_at(position, self.key_attr())
+            self._key_positions[key] = position
+            self._position_keys[position] = key
+        for attr, index in self.indexes.items():
+            if index.built:
+                index.add(position, self.value_at(position, attr))
+
+    def share(self):
+        """
+        mark records as shared with another Popolo - objects will take
+        a copy before changing them
+        """
+        self.shared = True
+        for o in self.objects:
+            if o is not None:
+                o._shared = True
+
+    def object_changed(self, obj, key):
+        """
+        called by objects in this collection when one of their values is
+        set.
+        """
+        self._version += 1
+        position = self.position_of(obj)
+        if self._key_positions is not None and \
+                (key == "id" or self.key_attr() != "id"):
+            self.update_key(position)
+        for attr, index in self.indexes.items():
+            if index.built and index.depends_on(key):
+                index.update(position, getattr(obj, attr))
+
+    def merge(self,other,new_collection,unique_on="id",report=None,
+              prefer=None):
         """
         returns a new collection that fuses itself with an 'other' collection
         of same class.
         Where the same unique_on value exists in both - the 'larger' is kept
         
+        unique_on is the name of an attribute, a function of an object, or
+        a strategy with a keyed method (see matcher.FuzzyNameMatcher).
+        
         more complex merges can be added by overriding PopoloObject.absorb
+        
+        What happened is recorded in report, a
+        merging.CollectionMergeReport, if one is given.
+        
+        prefer(kept, other) decides whether other replaces kept when
+        they match - by default, if it has more information (see
+        PopoloObject.information_content).
+        """
+        return self.merge_many([other], new_collection, unique_on, report,
+                               prefer)
+
+    def merge_many(self, others, new_collection, unique_on="id",
+                   report=None, prefer=None):
+        """
+        merge this collection and each of others in turn into
+        new_collection, returning the id changes needed (see merge).
+        
+        Each collection is read once, its objects matched against those
+        kept so far - a match replaces the kept object if it is 'larger'
+        (ties keep the earlier). Within one collection the last of any
+        objects with the same key is used. Objects are added to
+        new_collection in the order their keys were first seen.
         """
         
         new = new_collection
+        if report is None:
+            report = CollectionMergeReport(
+                self.__class__.object_class.__name__, unique_on)
+        timings = report.timings
+                
+        if prefer is None:
+            prefer = prefer_fuller
                 
         amend_ids = unique_on != "id" #if not unique on ids, will need to amend backwards
         ids_to_change = []
         
-        ours = set([getattr(x,unique_on) for x in self])
-        theirs = set([getattr(x,unique_on) for x in other])
-        our_lookup = {getattr(x,unique_on):x for x in self}
-        their_lookup = {getattr(x,unique_on):x for x in other}
+        kept = []
+        sources = [] #index of the collection each of kept came from
+        slots = {} #key -> position in kept
+        for source, collection in enumerate([self] + list(others)):
+            report.input_counts.append(len(collection))
+            with timed(timings, "match"):
+                keyed = self.keyed_for_merge(kept, collection, unique_on,
+                                             slots)
+            with timed(timings, "absorb"):
+                latest = {}
+                order = []
+                for k, x in keyed:
+                    if k not in latest:
+                        order.append(k)
+                    latest[k] = x
+                for k in order:
+                    t = latest[k]
+                    if k not in slots:
+                        slots[k] = len(kept)
+                        kept.append(t)
+                        sources.append(source)
+                        continue
+                    slot = slots[k]
+                    o = kept[slot]
+                    if prefer(o, t):
+                        keep,lose = t,o
+                        winner,loser = source,sources[slot]
+                    else:
+                        keep,lose = o,t
+                        winner,loser = sources[slot],source
+                    
+                    keep.absorb(lose) #runs any model level synchronization
+                    
+                    kept[slot] = keep
+                    sources[slot] = winner
+                    ids_to_change.append((lose.id,keep.id))
+                    report.contested.append(
+                        Contest(k, winner, loser, keep.id, lose.id))
         
-        both = ours.union(theirs)
-        contested = ours.intersection(theirs)
-        uncontested = both.difference(contested)
-        
-        for c in contested:
-            o = our_lookup[c]
-            t = their_lookup[c]
-            
-            if o < t: #if theirs has more information, keep
-                keep,lose = t,o
-            else:
-                keep,lose = o,t
-            
-            keep.absorb(lose) #runs any model level synchronization
-            
-            new.add(keep)
-            ids_to_change.append((lose.id,keep.id))       
-            
-        for u in uncontested:
-            o = our_lookup.get(u,None)
-            t = their_lookup.get(u,None)
-
-            if o and not t:
-                new.add(o)
-            elif t and not o:
-                new.add(t)
+        with timed(timings, "add"):
+            for x in kept:
+                new.add(x)
         
         if amend_ids == False:
             ids_to_change = []
         
-        merge_message = "merging {0} on {1}: {2} + {3} = {4}. {5} ids to change."
-            
-        print (merge_message.format(self.__class__.object_class.__name__,
-                                   unique_on,
-                                   len(self),
-                                   len(other),
-                                   len(new),
-                                   len(ids_to_change)))
-        
+        report.output_count = len(new)
+        report.ids_to_change = ids_to_change
         return ids_to_change
 
+    def keyed_for_merge(self, kept, collection, unique_on, slots):
+        """
+        [(key, object)] for the objects of collection - objects matching
+        one in kept get the key it is under in slots.
+        
+        A strategy (see matcher.FuzzyNameMatcher) is asked to match
+        collection against kept, and slots is rekeyed with its keys.
+        """
+        if hasattr(unique_on, "keyed"):
+            kept_keys, keyed = unique_on.keyed(kept, collection)
+            slots.clear()
+            for position, (k, x) in enumerate(kept_keys):
+                slots[k] = position
+            return keyed
+        if callable(unique_on):
+            key = unique_on
+        else:
+            key = lambda x: getattr(x, unique_on)
+        return [(key(x), x) for x in collection]
+
+
+def prefer_fuller(kept, other):
+    """
+    default merge policy - replace kept with other if other has more
+    information. Ties keep what was already kept.
+    """
+    return kept < other
+
+
+class IdentifiedCollectionMixin(object):
+    """
+    lookups by (scheme, identifier) for collections of objects with
+    identifiers, from an index built on first use and kept up to date
+    as objects are added or their identifiers set.
+    """
+
+    _identifier_index = None
+
+    def identifier_keys_at(self, position):
+        identifiers = self.data_at(position).get("identifiers") or []
+        return [(i.get("scheme"), i.get("identifier")) for i in identifiers]
+
+    def identifier_index(self):
+        if self._identifier_index is None:
+            index = MultiValueIndex()
+            for position in range(len(self.objects)):
+                index.set(position, self.identifier_keys_at(position))
+            self._identifier_index = index
+        return self._identifier_index
+
+    def added(self, position):
+        super(IdentifiedCollectionMixin, self).added(position)
+        if self._identifier_index is not None:
+            self._identifier_index.set(position,
+                                       self.identifier_keys_at(position))
+
+    def object_changed(self, obj, key):
+        super(IdentifiedCollectionMixin, self).object_changed(obj, key)
+        if self._identifier_index is not None and key == "identifiers":
+            position = self.position_of(obj)
+            self._identifier_index.set(position,
+                                       self.identifier_keys_at(position))
+
+    def by_identifier(self, scheme, identifier):
+        """
+        objects with identifier under scheme, in collection order
+        """
+        try:
+            positions = self.identifier_index().lookup((scheme, identifier))
+        except TypeError:
+            return []
+        return [self.get_object(p) for p in positions]
+
+
+class NamedCollectionMixin(object):
+    """
+    search by name for collections of objects with names. Names are
+    compared normalized (see normalize_name), and each object's
+    other_names are searched along with name_fields.
+    """
+
+    name_fields = ("name", "sort_name", "family_name", "given_name")
+    _name_search_index = None
 
+    def names_of(self, position):
+        data = self.data_at(position)
+        names = [data.get(f) for f in self.name_fields]
+        names.extend(n.get("name") for n in data.get("other_names") or [])
+        return names
+
+    def name_search_index(self):
+        if self._name_search_index is None:
+            self._name_search_index = NameIndex.build(
+                (position, self.names_of(position))
+                for position in range(len(self.objects)))
+        return self._name_search_index
+
+    def added(self, position):
+        super(NamedCollectionMixin, self).added(position)
+        if self._name_search_index is not None:
+            self._name_search_index.set(position, self.names_of(position))
+
+    def object_changed(self, obj, key):
+        super(NamedCollectionMixin, self).object_changed(obj, key)
+        if self._name_search_index is not None and \
+                (key in self.name_fields or key == "other_names"):
+            position = self.position_of(obj)
+            self._name_search_index.set(position, self.names_of(position))
+
+    def by_name(self, name):
+        """
+        objects with name as any of their names, ignoring case and
+        accents
+        """
+        positions = self.name_search_index().lookup(name)
+        return [self.get_object(p) for p in positions]
+
+    def by_name_prefix(self, prefix):
+        """
+        objects with any name starting with prefix, ignoring case and
+        accents
+        """
+        positions = self.name_search_index().lookup_prefix(prefix)
+        return [self.get_object(p) for p in positions]
+
+
+class DatedSelectionMixin(object):
+    """
+    views by date, for dated collections and views of them
+    """
+
+    def overlapping(self, start, end):
+        """
+        a view of the objects that may have been current at some point
+        between start and end
+        """
+        return self.selecting(
+            lambda collection: collection.positions_overlapping(start, end))
+
+    def current_at(self, when):
+        """
+        a view of the objects that may have been current on when
+        """
+        return self.overlapping(when, when)
 
-class PersonCollection(PopoloCollection):
+    @property
+    def current(self):
+        return self.current_at(date.today())
+
+
+class DatedCollectionMixin(DatedSelectionMixin):
+    """
+    date range queries over collections of objects with start_date and
+    end_date (see CurrentMixin), answered from arrays of date ordinals
+    rather than by checking each object.
+
+    As with ApproxDate.possibly_between, an object counts as current if
+    its dates could include the date asked about - the earliest its
+    start could be and the latest its end could be are used.
+
+    Queries go through an IntervalIndex over those ordinals, built on
+    first use and updated as objects are added or their dates change.
+    """
+
+    _date_bounds = None
+    _date_index = None
+
+    def date_bound(self, position):
+        """
+        (earliest start, latest end) ordinals for the record at position.
+        Missing dates are open-ended, as the ApproxDate.PAST and
+        ApproxDate.FUTURE defaults are.
+        """
+        data = self.data_at(position)
+        start = data.get("start_date")
+        end = data.get("end_date")
+        start = approx_date_getter(start).earliest_date if start else date.min
+        end = approx_date_getter(end).latest_date if end else date.max
+        return start.toordinal(), end.toordinal()
+
+    def date_bounds(self):
+        """
+        arrays of earliest start and latest end ordinals, by position.
+        Rebuilt when the collection changes.
+        """
+        cached = self._date_bounds
+        if cached is None or cached[0] != self._version:
+            earliest = array("i")
+            latest = array("i")
+            for position in range(len(self.objects)):
+                lo, hi = self.date_bound(position)
+                earliest.append(lo)
+                latest.append(hi)
+            cached = (self._version, earliest, latest)
+            self._date_bounds = cached
+        return cached[1], cached[2]
+
+    def date_index(self):
+        """
+        the IntervalIndex of date ordinals, built if needed
+        """
+        if self._date_index is None:
+            earliest, latest = self.date_bounds()
+            index = IntervalIndex()
+            for position, lo, hi in zip(count(), earliest, latest):
+                index.set(position, [(lo, hi, None)])
+            self._date_index = index
+        return self._date_index
+
+    def update_date_index(self, position):
+        if self._date_index is None:
+            return
+        try:
+            lo, hi = self.date_bound(position)
+        except ValueError:
+            # leave the error to be raised by the next query
+            self._date_index = None
+            return
+        self._date_index.set(position, [(lo, hi, None)])
+
+    def added(self, position):
+        super(DatedCollectionMixin, self).added(position)
+        self.update_date_index(position)
+
+    def object_changed(self, obj, key):
+        super(DatedCollectionMixin, self).object_changed(obj, key)
+        if key in ("start_date", "end_date"):
+            self.update_date_index(self.position_of(obj))
+
+    def positions_overlapping(self, start, end):
+        start = getattr(start, "earliest_date", start).toordinal()
+        end = getattr(end, "latest_date", end).toordinal()
+        return self.date_index().positions_overlapping(start, end)
+
+
+class IdentifiedViewMixin(object):
+    """
+    IdentifiedCollectionMixin lookups for views
+    """
+
+    def by_identifier(self, scheme, identifier):
+        return self.restricted(self.parent.by_identifier(scheme, identifier))
+
+
+class NamedViewMixin(object):
+    """
+    NamedCollectionMixin lookups for views
+    """
+
+    def by_name(self, name):
+        return self.restricted(self.parent.by_name(name))
+
+    def by_name_prefix(self, prefix):
+        return self.restricted(self.parent.by_name_prefix(prefix))
+
+
+class DatedViewMixin(DatedSelectionMixin):
+    """
+    DatedCollectionMixin queries for views
+    """
+
+    def date_bounds(self):
+        """
+        the date_bounds of the collection viewed - by position in it
+        """
+        return self.parent.date_bounds()
+
+    def positions_overlapping(self, start, end):
+        positions = self.positions()
+        return [p for p in self.parent.positions_overlapping(start, end)
+                if p in positions]
+
+
+class EventSelectionMixin(object):
+    """
+    views of events by classification
+    """
+
+    @property
+    def elections(self):
+        return self.filter(classification='general election')
+
+    @property
+    def legislative_periods(self):
+        return self.filter(classification='legislative period')
+
+
+class PersonCollectionView(NamedViewMixin, IdentifiedViewMixin,
+                           CollectionView):
+
+    def names_at(self, particular_date):
+        return self.parent.names_at_positions(
+            particular_date,
+            [o.position_in(self.parent) for o in self.object_list])
+
+class OrganizationCollectionView(NamedViewMixin, IdentifiedViewMixin,
+                                 CollectionView):
+    pass
+
+class MembershipCollectionView(DatedViewMixin, CollectionView):
+    pass
+
+class AreaCollectionView(NamedViewMixin, IdentifiedViewMixin,
+                         CollectionView):
+    pass
+
+class EventCollectionView(EventSelectionMixin, IdentifiedViewMixin,
+                          DatedViewMixin, CollectionView):
+    pass
+
+
+class PersonCollection(NamedCollectionMixin, IdentifiedCollectionMixin,
+                       PopoloCollection):
     object_class = Person
+    view_class = PersonCollectionView
+
+    _name_index = None
+
+    def name_index(self):
+        """
+        IntervalIndex of the dated other_names of each person, built on
+        first use
+        """
+        if self._name_index is None:
+            index = IntervalIndex()
+            for position in range(len(self.objects)):
+                index.set(position, self.name_ranges_at(position))
+            self._name_index = index
+        return self._name_index
+
+    def name_ranges_at(self, position):
+        other_names = self.data_at(position).get("other_names") or []
+        return historic_name_ranges(other_names)
+
+    def added(self, position):
+        super(PersonCollection, self).added(position)
+        if self._name_index is not None:
+            self._name_index.set(position, self.name_ranges_at(position))
+
+    def object_changed(self, obj, key):
+        super(PersonCollection, self).object_changed(obj, key)
+        if self._name_index is not None and key == "other_names":
+            position = self.position_of(obj)
+            self._name_index.set(position, self.name_ranges_at(position))
 
-class OrganizationCollection(PopoloCollection):
+    def names_at(self, particular_date):
+        """
+        {id: name} for every person - the names Person.name_at would
+        give for particular_date
+        """
+        return self.names_at_positions(particular_date,
+                                       range(len(self.objects)))
+
+    def names_at_positions(self, particular_date, positions):
+        """
+        names_at for the people at positions
+        """
+        date_string = str(particular_date)
+        wanted = set(positions)
+        historic = {}
+        for position, name in self.name_index().overlapping(date_string,
+                                                            date_string):
+            if position not in wanted:
+                continue
+            if position in historic:
+                msg = "Multiple names for {0} found at date {1}"
+                raise Exception(msg.format(self.get_object(position),
+                                           particular_date))
+            historic[position] = name
+        names = {}
+        for position in positions:
+            data = self.data_at(position)
+            names[data.get("id")] = historic.get(position, data.get("name"))
+        return names
+
+class OrganizationCollection(NamedCollectionMixin, IdentifiedCollectionMixin,
+                             PopoloCollection):
     object_class = Organization
+    view_class = OrganizationCollectionView
 
-class MembershipCollection(PopoloCollection):
+class MembershipCollection(DatedCollectionMixin, PopoloCollection):
     object_class = Membership
+    view_class = MembershipCollectionView
+    indexed_attributes = ("person_id", "legislative_period_id")
 
-class AreaCollection(PopoloCollection):
+class AreaCollection(NamedCollectionMixin, IdentifiedCollectionMixin,
+                     PopoloCollection):
     object_class = Area
+    view_class = AreaCollectionView
 
 class PostCollection(PopoloCollection):
     object_class = Post
 
-class EventCollection(PopoloCollection):
+class EventCollection(EventSelectionMixin, IdentifiedCollectionMixin,
+                      DatedCollectionMixin, PopoloCollection):
     object_class = Event
-    
-    @property
-    def elections(self):
-        elections_list = self.filter(classification='general election')
-        elections_data = [election.data for election in elections_list]
-        return EventCollection(elections_data, self.all_popolo)
-
-    @property
-    def legislative_periods(self):
-        lps_list = self.filter(classification='legislative period')
-        legislative_periods_data = [lp.data for lp in lps_list]
-        return EventCollection(legislative_periods_data, self.all_popolo)
+    view_class = EventCollectionView
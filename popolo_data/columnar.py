@@ -0,0 +1,311 @@
+"""
+Column-based storage for memberships
+
+Memberships are usually the largest collection in a Popolo file, and
+are mostly a fixed set of id references plus two dates.
+ColumnarMembershipCollection stores each of those fields as an array
+instead of keeping a dict per membership:
+
+    * ids are dictionary-encoded - each distinct id string is stored
+      once and the columns hold small integer codes
+    * start_date and end_date are encoded the same way, and the earliest
+      possible start and latest possible end are kept as date ordinals
+    * anything else (role, source, ...) is kept in a per-row dict
+
+Membership objects created from the collection are thin views on a
+row, and writing to them writes to the columns.
+
+Use ColumnarPopolo in place of Popolo to load memberships this way.
+"""
+from array import array
+from datetime import date
+
+import six
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+from .base import approx_date_getter
+from .collections import MembershipCollection
+from .importer import Popolo
+from .models import Membership
+
+EARLIEST = date.min.toordinal()
+LATEST = date.max.toordinal()
+
+
+class Codes(object):
+    """
+    dictionary encoding of strings as integers - 0 means no value
+    """
+
+    def __init__(self):
+        self.values = [None]
+        self.codes = {}
+
+    def encode(self, value):
+        try:
+            return self.codes[value]
+        except KeyError:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+            return code
+
+    def lookup(self, value):
+        """
+        code for value, or None if it has never been encoded
+        """
+        try:
+            return self.codes.get(value)
+        except TypeError:
+            return None
+
+
+class MembershipRow(MutableMapping):
+    """
+    dict-like view of one row of a ColumnarMembershipCollection, used
+    as the data of its Membership objects.
+    """
+
+    __slots__ = ("collection", "position")
+
+    def __init__(self, collection, position):
+        self.collection = collection
+        self.position = position
+
+    def __getitem__(self, key):
+        return self.collection.get_field(self.position, key)
+
+    def get(self, key, default=None):
+        try:
+            return self.collection.get_field(self.position, key)
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self.collection.set_field(self.position, key, value)
+
+    def __delitem__(self, key):
+        self.collection.del_field(self.position, key)
+
+    def __iter__(self):
+        return iter(self.collection.row_keys(self.position))
+
+    def __len__(self):
+        return len(self.collection.row_keys(self.position))
+
+    def __repr__(self):
+        return repr(self.collection.row_dict(self.position))
+
+    def __deepcopy__(self, memo):
+        return self.collection.row_dict(self.position)
+
+
+class ColumnarMembershipCollection(MembershipCollection):
+    """
+    MembershipCollection storing its fields as columns (see module
+    docstring). Rows are converted back to dicts for raw_data/json.
+    """
+
+    id_fields = Membership.id_fields
+    date_fields = ("start_date", "end_date")
+
+    def __init__(self, data_list, all_popolo):
+        self.codes = Codes()
+        self.date_codes = Codes()
+        self.id_columns = {f: array("i") for f in self.id_fields}
+        self.date_columns = {f: array("i") for f in self.date_fields}
+        self.start_earliest = array("i")
+        self.end_latest = array("i")
+        self.extras = []
+        super(ColumnarMembershipCollection, self).__init__([], all_popolo)
+        for data in data_list:
+            self.append_data(data)
+
+    def record(self, position):
+        return MembershipRow(self, position)
+
+    def data_at(self, position):
+        return self.row_dict(position)
+
+    def add_record(self, data):
+        position = len(self.extras)
+        for column in self.id_columns.values():
+            column.append(0)
+        for column in self.date_columns.values():
+            column.append(0)
+        self.start_earliest.append(EARLIEST)
+        self.end_latest.append(LATEST)
+        self.extras.append(None)
+        for key, value in six.iteritems(data):
+            self.set_field(position, key, value)
+        return position
+
+    def append(self, new):
+        super(ColumnarMembershipCollection, self).append(new)
+        new.data = MembershipRow(self, new._position)
+        #the row is owned by the columns, not shared with its old record
+        new._shared = False
+
+    add = append
+
+    def share(self):
+        #rows are copied into the columns, so are never shared
+        pass
+
+    def get_field(self, position, key):
+        column = self.id_columns.get(key)
+        if column is not None and column[position]:
+            return self.codes.values[column[position]]
+        column = self.date_columns.get(key)
+        if column is not None and column[position]:
+            return self.date_codes.values[column[position]]
+        extras = self.extras[position]
+        if extras is None:
+            raise KeyError(key)
+        return extras[key]
+
+    def set_field(self, position, key, value):
+        self.del_field(position, key, missing_ok=True)
+        if key in self.id_columns and isinstance(value, six.string_types):
+            self.id_columns[key][position] = self.codes.encode(value)
+            return
+        if key in self.date_columns and isinstance(value, six.string_types):
+            try:
+                parsed = approx_date_getter(value)
+            except ValueError:
+                pass
+            else:
+                self.date_columns[key][position] = \
+                    self.date_codes.encode(value)
+                if key == "start_date":
+                    self.start_earliest[position] = \
+                        parsed.earliest_date.toordinal()
+                else:
+                    self.end_latest[position] = \
+                        parsed.latest_date.toordinal()
+                return
+        if self.extras[position] is None:
+            self.extras[position] = {}
+        self.extras[position][key] = value
+
+    def del_field(self, position, key, missing_ok=False):
+        column = self.id_columns.get(key) or self.date_columns.get(key)
+        if column is not None and column[position]:
+            column[position] = 0
+            if key == "start_date":
+                self.start_earliest[position] = EARLIEST
+            elif key == "end_date":
+                self.end_latest[position] = LATEST
+            return
+        extras = self.extras[position]
+        if extras is not None and key in extras:
+            del extras[key]
+        elif not missing_ok:
+            raise KeyError(key)
+
+    def row_keys(self, position):
+        keys = [f for f in self.id_fields if self.id_columns[f][position]]
+        keys.extend(f for f in self.date_fields
+                    if self.date_columns[f][position])
+        if self.extras[position]:
+            keys.extend(self.extras[position])
+        return keys
+
+    def row_dict(self, position):
+        return {k: self.get_field(position, k)
+                for k in self.row_keys(position)}
+
+    def value_at(self, position, attr):
+        key = self.raw_key(attr)
+        if key is not None:
+            try:
+                return self.get_field(position, key)
+            except KeyError:
+                return None
+        return super(ColumnarMembershipCollection, self).value_at(
+            position, attr)
+
+    def values_of(self, attr):
+        key = self.raw_key(attr)
+        if key in self.id_columns:
+            values = self.codes.values
+            extras = self.extras
+            return [(p, values[c] if c else (extras[p] or {}).get(key))
+                    for p, c in enumerate(self.id_columns[key])]
+        return super(ColumnarMembershipCollection, self).values_of(attr)
+
+    def column_positions(self, key, value):
+        """
+        positions where the id column key holds value
+        """
+        code = self.codes.lookup(value)
+        if code is None:
+            return []
+        return [p for p, c in enumerate(self.id_columns[key]) if c == code]
+
+    def date_bounds(self):
+        """
+        the earliest start and latest end columns - any dates that
+        couldn't be stored in columns are read through their objects
+        """
+        cached = self._date_bounds
+        if cached is not None and cached[0] == self._version:
+            return cached[1], cached[2]
+        earliest = self.start_earliest
+        latest = self.end_latest
+        copied = False
+        for position, extras in enumerate(self.extras):
+            if extras and ("start_date" in extras or "end_date" in extras):
+                if not copied:
+                    earliest = array("i", earliest)
+                    latest = array("i", latest)
+                    copied = True
+                earliest[position], latest[position] = \
+                    self.date_bound(position)
+        self._date_bounds = (self._version, earliest, latest)
+        return earliest, latest
+
+    def matching(self, criteria, predicates=(), selectors=()):
+        """
+        criteria on id fields are checked against the columns, without
+        creating objects
+        """
+        positions = None
+        remaining = []
+        for k, v in criteria:
+            key = self.raw_key(k)
+            if key not in self.id_columns \
+                    or not isinstance(v, six.string_types):
+                remaining.append((k, v))
+                continue
+            if positions is None:
+                index = self.built_index(k)
+                if index is not None:
+                    positions = index.lookup(v)
+                else:
+                    positions = self.column_positions(key, v)
+            else:
+                code = self.codes.lookup(v)
+                column = self.id_columns[key]
+                positions = [p for p in positions if column[p] == code]
+        positions = self.selected_positions(selectors, positions)
+        if positions is None:
+            positions = range(len(self.objects))
+        get_object = self.get_object
+        return [o for o in (get_object(p) for p in positions)
+                if all(getattr(o, k) == v for k, v in remaining)
+                and all(p(o) for p in predicates)]
+
+
+class ColumnarPopolo(Popolo):
+    """
+    Popolo that stores memberships in a ColumnarMembershipCollection
+    """
+
+    collection_classes = [
+        (name, ColumnarMembershipCollection if name == "memberships"
+         else collection_class)
+        for name, collection_class in Popolo.collection_classes]
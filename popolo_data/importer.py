@@ -7,40 +7,164 @@ import io
 import six
 from copy import deepcopy
 
-from .collections import (PopoloCollection,
+from .collections import (PopoloCollection, IdentifiedCollectionMixin,
     AreaCollection, EventCollection, MembershipCollection, PersonCollection,
     OrganizationCollection, PostCollection)
+from .merging import CollectionMergeReport, MergeReport, timed
+from .streaming import iter_records
+
+def intern_ids(record, table):
+    """
+    replace id values ("id" and any key ending "_id") in record with the
+    equal string already in table, so repeated ids share one string.
+    """
+    for k, v in record.items():
+        if (k == "id" or k.endswith("_id")) \
+                and isinstance(v, six.string_types):
+            record[k] = table.setdefault(v, v)
+
+
+def combine_id_changes(id_list):
+    """
+    returns a dict of old id -> new id with the same effect as making
+    each (old, new) replacement in id_list in turn - so [(a, b), (b, c)]
+    gives {a: c, b: c}
+    """
+    final = {} # original id -> current id
+    holders = {} # current id -> original ids now holding it
+    for old, new in id_list:
+        if old == new:
+            continue
+        moving = holders.pop(old, set())
+        if old not in final:
+            moving.add(old)
+        for original in moving:
+            final[original] = new
+        holders.setdefault(new, set()).update(moving)
+    return {k: v for k, v in final.items() if k != v}
+
+
+def merge_records(popolo_class, name, record_lists, unique_on, prefer,
+                  remap):
+    """
+    merge the name collection of several sources, given as a list of
+    raw records per source, after applying remap to them.
+    
+    Run in worker processes by Popolo.merge_many - returns the raw
+    records of the merged collection, its id changes and its
+    merging.CollectionMergeReport.
+    """
+    collections = [getattr(popolo_class.adopt({name: records}, only=[name]),
+                           name)
+                   for records in record_lists]
+    new = getattr(popolo_class({}, only=[name]), name)
+    report = CollectionMergeReport(name, unique_on)
+    with timed(report.timings, "remap"):
+        if remap:
+            for collection in collections:
+                collection.remap_ids(remap)
+    ids_to_change = collections[0].merge_many(collections[1:], new,
+                                              unique_on, report, prefer)
+    return new.raw_data(), ids_to_change, report
+
 
 class NotAValidType(TypeError):
     pass
 
+class CollectionNotLoaded(AttributeError):
+    pass
+
 class Popolo(object):
 
+    merge_report = None #set on the results of merges
+
+    collection_classes = [("persons", PersonCollection),
+                          ("organizations", OrganizationCollection),
+                          ("memberships", MembershipCollection),
+                          ("areas", AreaCollection),
+                          ("posts", PostCollection),
+                          ("events", EventCollection),
+                          ]
+
     @classmethod
-    def from_filename(cls, filename):
+    def from_filename(cls, filename, only=None, exclude=None):
         with open(filename, encoding="utf-8") as f:
-            return cls(json.load(f))
+            return cls.from_stream(f, only=only, exclude=exclude)
 
     @classmethod
-    def from_url(cls, url):
+    def from_stream(cls, fileobj, only=None, exclude=None):
+        """
+        build a Popolo from a file object, one record at a time, without
+        holding the whole parsed document in memory.
+        
+        Arrays for collections that aren't loaded are skipped unparsed.
+        """
+        popolo = cls({}, only=only, exclude=exclude)
+        collections = dict(popolo.collections)
+        id_table = {}
+        for key, record in iter_records(fileobj, collections):
+            intern_ids(record, id_table)
+            collections[key].append_data(record)
+        return popolo
+
+    @classmethod
+    def from_url(cls, url, only=None, exclude=None):
         r = requests.get(url)
-        return cls(r.json())
+        json_data = r.json()
+        id_table = {}
+        for name, collection_class in cls.collections_to_load(only, exclude):
+            for record in json_data.get(name, []):
+                intern_ids(record, id_table)
+        return cls.adopt(json_data, only=only, exclude=exclude)
 
     @classmethod
     def new(cls):
         return cls({})
 
-    def __init__(self, json_data=None):
+    @classmethod
+    def adopt(cls, json_data, only=None, exclude=None):
+        """
+        use json_data without copying it - it belongs to the new Popolo
+        and will be changed along with its objects.
+        """
+        return cls(json_data, copy=False, only=only, exclude=exclude)
+
+    @classmethod
+    def collections_to_load(cls, only=None, exclude=None):
+        """
+        names and classes of the collections selected by only/exclude
+        """
+        names = [name for name, collection_class in cls.collection_classes]
+        for selection in (only, exclude):
+            unknown = set(selection or []).difference(names)
+            if unknown:
+                msg = "Unknown collection(s): {0}"
+                raise ValueError(msg.format(", ".join(sorted(unknown))))
+        return [(name, collection_class)
+                for name, collection_class in cls.collection_classes
+                if (only is None or name in only)
+                and (exclude is None or name not in exclude)]
+
+    def __init__(self, json_data=None, copy=True, only=None, exclude=None):
+        """
+        only and exclude restrict which collections (e.g. "persons",
+        "memberships") are loaded. Accessing one that wasn't raises
+        CollectionNotLoaded.
+        """
         if json_data == None: #insulate from other instances
             json_data = {}
-        json_data = deepcopy(json_data)
-        json_get = json_data.get
-        self.persons = PersonCollection(json_get('persons', []), self)
-        self.organizations = OrganizationCollection(json_get('organizations', []), self)
-        self.memberships =  MembershipCollection(json_get('memberships', []), self)
-        self.areas = AreaCollection(json_get('areas', []), self)
-        self.posts = PostCollection(json_get('posts', []), self)
-        self.events = EventCollection(json_get('events', []), self)
+        for name, collection_class in self.collections_to_load(only, exclude):
+            data_list = json_data.get(name, [])
+            if copy:
+                data_list = deepcopy(data_list)
+            setattr(self, name, collection_class(data_list, self))
+
+    def __getattr__(self, name):
+        if name in dict(self.__class__.collection_classes):
+            msg = "The {0} collection was not loaded for this Popolo."
+            raise CollectionNotLoaded(msg.format(name))
+        msg = "'{0}' object has no attribute '{1}'"
+        raise AttributeError(msg.format(self.__class__.__name__, name))
    
     @property
     def elections(self):
@@ -68,6 +192,34 @@ class Popolo(object):
     def latest_term(self):
         return self.latest_legislative_period
 
+    def by_identifier(self, scheme, identifier):
+        """
+        persons, organizations, areas and events with identifier under
+        scheme, e.g. by_identifier('wikidata', 'Q42')
+        """
+        found = []
+        for collection in self.identified_collections():
+            found.extend(collection.by_identifier(scheme, identifier))
+        return found
+
+    def by_identifiers(self, scheme, identifiers):
+        """
+        {identifier: [objects]} for each of identifiers under scheme
+        """
+        collections = self.identified_collections()
+        return {i: [o for collection in collections
+                    for o in collection.by_identifier(scheme, i)]
+                for i in identifiers}
+
+    def identified_collections(self):
+        """
+        loaded collections that can be searched by identifier
+        """
+        return [self.__dict__[name]
+                for name, collection_class in self.collection_classes
+                if name in self.__dict__
+                and issubclass(collection_class, IdentifiedCollectionMixin)]
+
     def add(self,new):
         """
         find the correct collection for the object and add it
@@ -87,6 +239,19 @@ class Popolo(object):
         if len(to_return) != len(ll):
             raise NotAValidType("This type can't be used with Popolo.")
 
+    def shared_copy(self):
+        """
+        returns a copy of this Popolo that shares records with it.
+        
+        Objects on both sides take a private copy of their record the
+        first time it is changed, so neither sees the other's changes.
+        """
+        new = self.__class__.adopt(self.json_data)
+        for popolo in (self, new):
+            for k, collection in popolo.collections:
+                collection.share()
+        return new
+
     def to_filename(self,filename):
         di = {k:v.raw_data() for k,v in self.collections}
         content = json.dumps(di,indent=4, sort_keys=True, ensure_ascii=False)
@@ -111,43 +276,195 @@ class Popolo(object):
         Will replace the 'old' id across all objects.
         When two popolos are being merged, one set of ids needs to take
         priority. 
+        
+        The replacements are combined first (see combine_id_changes), so
+        each object is visited at most once per id attribute.
         """
-        for k,v in self.collections:
-            for old,new in id_list:
-                if old != new:
-                    for o in v.object_list:
-                        for prop in six.iterkeys(o.__class__.__dict__):
-                            if "_id" in prop:
-                                if getattr(o,prop) == old:
-                                    setattr(o,prop,new)
+        remap = combine_id_changes(id_list)
+        if remap:
+            for k,v in self.collections:
+                v.remap_ids(remap)
                                     
-    def merge(self,other):
+    def merge(self,other,unique_on=None,prefer=None,workers=None):
         """
         combine with another popolo, preserving specified id field
+        
+        unique_on can override how objects in a collection are matched,
+        e.g. {"persons": FuzzyNameMatcher(0.85)}, and prefer which of two
+        matched objects is kept - see PopoloCollection.merge.
+        
+        workers merges collections in that many processes - see
+        merge_many.
         """
-        #we need to make copies
+        return self.__class__.merge_many([self, other], unique_on=unique_on,
+                                         prefer=prefer, workers=workers)
+
+    #collections in the order they are merged, and what they're unique on
+    merge_order = [
+                  ("organizations","name"),#unique on name
+                  ("events","id"), #unique on id
+                  ("persons","name"),
+                  ("areas","name"),
+                  ("posts","id"),
+                  ("memberships","id"),
+                  ]
+
+    @classmethod
+    def merge_many(cls, sources, unique_on=None, prefer=None, workers=None):
+        """
+        combine any number of popolos (or the filenames of popolo files)
+        in one pass over each collection. Where objects are matched, the
+        'larger' is kept, with ties going to the earlier source - as if
+        merging them in turn, but without the intermediate copies.
         
-        safe_ours = self.__class__(self.json_data)
-        safe_other = self.__class__(other.json_data)
-        new = self.__class__({})
+        Popolos passed in aren't changed - a copy-on-write copy of
+        each is used (see shared_copy). Id changes from each collection
+        are applied to the later collections before they are merged,
+        and any they were merged without to the result at the end (see
+        amend_merged_ids).
         
-        process_order = [
-                        ("organizations","name"),#unique on name
-                        ("events","id"), #unique on id
-                        ("persons","name"),
-                        ("areas","name"),
-                        ("posts","id"),
-                        ("memberships","id"),
-                        ]
-    
-        for p,merge_value in process_order:
-
-            our_col = getattr(safe_ours,p)
-            their_col = getattr(safe_other,p)
-            new_col = getattr(new,p)
-            
-            ids_to_change = our_col.merge(their_col,new_col,merge_value)
-            safe_ours.amend_ids(ids_to_change)
-            safe_other.amend_ids(ids_to_change)
-            
+        The result's merge_report is a merging.MergeReport of what was
+        done.
+        
+        With workers, collections are merged in a pool of that many
+        processes, each as soon as the collections whose id changes it
+        depends on are done (see merge_dependencies). Workers are sent
+        raw records, so unique_on and prefer must be picklable - no
+        lambdas. The result is the same as merging in this process.
+        """
+        unique_on = unique_on or {}
+        unknown = set(unique_on).difference(p for p, v in cls.merge_order)
+        if unknown:
+            msg = "Unknown collection(s): {0}"
+            raise ValueError(msg.format(", ".join(sorted(unknown))))
+        
+        report = MergeReport()
+        popolos = []
+        with timed(report.timings, "load"):
+            for source in sources:
+                if isinstance(source, Popolo):
+                    popolos.append(source.shared_copy())
+                else:
+                    popolos.append(cls.from_filename(source))
+        new = cls({})
+        new.merge_report = report
+        if not popolos:
+            return new
+        
+        if workers:
+            changes = cls.merge_in_pool(popolos, new, unique_on, prefer,
+                                        workers)
+            with timed(report.timings, "amend"):
+                report.remap = combine_id_changes(
+                    [change for later in changes for change in later])
+                new.amend_merged_ids(changes)
+            return new
+        
+        ids_to_change = []
+        changes = [] #the id changes from each collection, in merge_order
+        for p,merge_value in cls.merge_order:
+            merge_value = unique_on.get(p, merge_value)
+            collection_report = report.add_collection(p, merge_value)
+            collections = [getattr(popolo, p) for popolo in popolos]
+            with timed(collection_report.timings, "remap"):
+                remap = combine_id_changes(ids_to_change)
+                if remap:
+                    for collection in collections:
+                        collection.remap_ids(remap)
+            with timed(report.timings, "merge"):
+                changes.append(collections[0].merge_many(
+                    collections[1:], getattr(new, p), merge_value,
+                    collection_report, prefer))
+            ids_to_change.extend(changes[-1])
+        
+        with timed(report.timings, "amend"):
+            report.remap = combine_id_changes(ids_to_change)
+            new.amend_merged_ids(changes)
         return new
+
+    def amend_merged_ids(self, changes):
+        """
+        apply the id changes from merge_many - a list per collection, in
+        merge_order.
+        
+        Each collection was merged with the changes from the collections
+        before it already applied, so only gets those from itself and
+        the collections after it. Applying them all again would move ids
+        that lost one contest but won another, e.g. {1: 3, 2: 1} takes
+        a 2 that is now 1 on to 3.
+        """
+        for i, (p, merge_value) in enumerate(self.merge_order):
+            remap = combine_id_changes([change for later in changes[i:]
+                                        for change in later])
+            if remap:
+                getattr(self, p).remap_ids(remap)
+
+    @classmethod
+    def merge_dependencies(cls, new, unique_on):
+        """
+        {collection name: names of the collections it waits for} for
+        merge_many. A collection is merged with the id changes from every
+        collection before it in merge_order, so it waits for those that
+        change ids (aren't unique on "id") - unless it holds no ids of
+        other objects for the changes to affect.
+        """
+        dependencies = {}
+        earlier = []
+        for p, merge_value in cls.merge_order:
+            merge_value = unique_on.get(p, merge_value)
+            if getattr(new, p).id_attributes():
+                dependencies[p] = list(earlier)
+            else:
+                dependencies[p] = []
+            if merge_value != "id":
+                earlier.append(p)
+        return dependencies
+
+    @classmethod
+    def merge_in_pool(cls, popolos, new, unique_on, prefer, workers):
+        """
+        merge each collection of popolos into new in a process pool (see
+        merge_many), returning the id changes from each collection, in
+        merge_order.
+        """
+        #imported here so the rest of the module works without
+        #concurrent.futures (on python 2 it needs the futures backport)
+        from concurrent.futures import (ProcessPoolExecutor,
+            FIRST_COMPLETED, wait)
+        
+        report = new.merge_report
+        dependencies = cls.merge_dependencies(new, unique_on)
+        changes = {}
+        reports = {}
+        waiting = [p for p, merge_value in cls.merge_order]
+        running = {}
+        with timed(report.timings, "merge"):
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                while waiting or running:
+                    for p in list(waiting):
+                        if any(q not in changes for q in dependencies[p]):
+                            continue
+                        waiting.remove(p)
+                        remap = combine_id_changes(
+                            [change for q in dependencies[p]
+                             for change in changes[q]])
+                        record_lists = [getattr(popolo, p).raw_data()
+                                        for popolo in popolos]
+                        merge_value = unique_on.get(
+                            p, dict(cls.merge_order)[p])
+                        future = pool.submit(merge_records, cls, p,
+                                             record_lists, merge_value,
+                                             prefer, remap)
+                        running[future] = p
+                    done, pending = wait(running,
+                                         return_when=FIRST_COMPLETED)
+                    for future in done:
+                        p = running.pop(future)
+                        records, changes[p], reports[p] = future.result()
+                        collection = getattr(new, p)
+                        for record in records:
+                            collection.append_data(record)
+        
+        for p, merge_value in cls.merge_order:
+            report.collections.append(reports[p])
+        return [changes[p] for p, merge_value in cls.merge_order]
@@ -0,0 +1,341 @@
+"""
+Secondary indexes kept by Popolo Collections
+
+"""
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+
+import six
+import unidecode
+
+
+class _Unhashable(object):
+
+    def __repr__(self):
+        return "<unhashable>"
+
+UNHASHABLE = _Unhashable()
+
+
+class AttributeIndex(object):
+    """
+    Maps the value of an attribute to the positions (within the owning
+    collection) of the objects holding that value.
+
+    Positions in each bucket are kept in collection order, so results
+    come back in the same order a linear scan would produce.
+
+    Objects whose value can't be hashed are kept to one side and
+    returned as candidates for every lookup - callers are expected to
+    check candidates against the actual value.
+    """
+
+    def __init__(self, attr, data_key=None):
+        self.attr = attr
+        self.data_key = data_key
+        self.buckets = {}
+        self.keys = {}
+        self.unhashable = []
+        self.built = False
+
+    def __len__(self):
+        return len(self.keys)
+
+    def depends_on(self, key):
+        """
+        does a change to key in an object's data affect the indexed value?
+        An index without a data_key (e.g. over a computed property) has
+        to be updated on every change.
+        """
+        return self.data_key is None or self.data_key == key
+
+    def add(self, position, value):
+        try:
+            bucket = self.buckets.setdefault(value, [])
+        except TypeError:
+            bucket = self.unhashable
+            value = UNHASHABLE
+        if bucket and bucket[-1] > position:
+            insort(bucket, position)
+        else:
+            bucket.append(position)
+        self.keys[position] = value
+
+    def remove(self, position):
+        value = self.keys.pop(position)
+        if value is UNHASHABLE:
+            bucket = self.unhashable
+        else:
+            bucket = self.buckets[value]
+        bucket.remove(position)
+        if not bucket and value is not UNHASHABLE:
+            del self.buckets[value]
+
+    def update(self, position, value):
+        """
+        move the object at position to the bucket for value
+        """
+        if position in self.keys:
+            old = self.keys[position]
+            if old is not UNHASHABLE and old == value \
+                    and type(old) == type(value):
+                return
+            self.remove(position)
+        self.add(position, value)
+
+    def lookup(self, value):
+        """
+        positions of objects that may hold value, in collection order.
+        None if value can't be looked up in the index.
+        """
+        try:
+            bucket = self.buckets.get(value, [])
+        except TypeError:
+            return None
+        if self.unhashable:
+            return sorted(bucket + self.unhashable)
+        return list(bucket)
+
+
+
+class MultiValueIndex(object):
+    """
+    Like AttributeIndex, but each position can hold any number of
+    (hashable) keys - the (scheme, identifier) pairs of an object's
+    identifiers, say.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set(self, position, keys):
+        """
+        replace the keys held for position. Keys that can't be hashed
+        can't be looked up, so are left out.
+        """
+        self.remove(position)
+        held = set()
+        for key in keys:
+            try:
+                if key in held:
+                    continue
+            except TypeError:
+                continue
+            held.add(key)
+            bucket = self.buckets.setdefault(key, [])
+            if bucket and bucket[-1] > position:
+                insort(bucket, position)
+            else:
+                bucket.append(position)
+        self.keys[position] = held
+
+    def remove(self, position):
+        for key in self.keys.pop(position, ()):
+            bucket = self.buckets[key]
+            bucket.remove(position)
+            if not bucket:
+                del self.buckets[key]
+
+    def lookup(self, key):
+        """
+        positions holding key, in collection order
+        """
+        return list(self.buckets.get(key, []))
+
+
+
+def normalize_name(name):
+    """
+    name transliterated to ASCII, lower-cased and with runs of
+    whitespace collapsed, for comparing names loosely
+    """
+    folded = unidecode.unidecode(six.text_type(name))
+    return u" ".join(folded.lower().split())
+
+
+class NameIndex(MultiValueIndex):
+    """
+    MultiValueIndex of normalized names, that can also find names
+    starting with a prefix. The distinct names are kept sorted, so a
+    prefix lookup is a binary search plus the matches.
+    """
+
+    def __init__(self):
+        super(NameIndex, self).__init__()
+        self.sorted_keys = []
+
+    @classmethod
+    def build(cls, names):
+        """
+        an index of names, an iterable of (position, names) pairs. The
+        distinct names are sorted once at the end, rather than inserted
+        into sorted_keys one at a time as set does.
+        """
+        index = cls()
+        for position, held in names:
+            MultiValueIndex.set(
+                index, position, [normalize_name(n) for n in held if n])
+        index.sorted_keys = sorted(index.buckets)
+        return index
+
+    def set(self, position, names):
+        super(NameIndex, self).set(
+            position, [normalize_name(n) for n in names if n])
+        for key in self.keys[position]:
+            if self.buckets[key] == [position]:
+                insort(self.sorted_keys, key)
+
+    def remove(self, position):
+        keys = self.keys.get(position, ())
+        super(NameIndex, self).remove(position)
+        for key in keys:
+            if key not in self.buckets:
+                del self.sorted_keys[bisect_left(self.sorted_keys, key)]
+
+    def lookup(self, name):
+        return super(NameIndex, self).lookup(normalize_name(name))
+
+    def lookup_prefix(self, prefix):
+        """
+        positions holding a name starting with prefix, in collection
+        order
+        """
+        prefix = normalize_name(prefix)
+        keys = self.sorted_keys
+        positions = set()
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            positions.update(self.buckets[keys[i]])
+        return sorted(positions)
+
+
+class IntervalIndex(object):
+    """
+    Maps positions (within the owning collection) to closed intervals
+    (lo, hi, payload), and finds the ones overlapping a range.
+
+    Intervals are kept in a centered interval tree, so queries take
+    O(log n + k). Intervals set since the tree was built are kept to
+    one side and checked directly, until there are enough of them that
+    the tree is rebuilt on the next query. Endpoints can be anything
+    that can be compared - date ordinals or iso strings, say.
+    """
+
+    min_pending = 32
+
+    def __init__(self):
+        self.intervals = {}
+        self.tree = None
+        self.pending = set()
+        self.stale = set()
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def set(self, position, intervals):
+        """
+        replace the intervals held for position. Intervals ending
+        before they start can't overlap anything, and are dropped.
+        """
+        if position not in self.pending and position in self.intervals:
+            self.stale.add(position)
+        self.intervals[position] = [i for i in intervals if i[0] <= i[1]]
+        self.pending.add(position)
+
+    def remove(self, position):
+        if position in self.intervals:
+            self.set(position, [])
+
+    def rebuild(self):
+        self.tree = build_interval_tree(
+            [(lo, hi, position, payload)
+             for position, intervals in self.intervals.items()
+             for lo, hi, payload in intervals])
+        self.pending = set()
+        self.stale = set()
+
+    def search(self, start, end):
+        """
+        (lo, hi, position, payload) for every interval overlapping start
+        to end, in no particular order
+        """
+        if len(self.pending) > max(self.min_pending,
+                                   len(self.intervals) ** 0.5):
+            self.rebuild()
+        found = search_interval_tree(self.tree, start, end)
+        if self.stale:
+            skip = self.stale
+            found = [e for e in found if e[2] not in skip]
+        for position in self.pending:
+            found.extend((lo, hi, position, payload)
+                         for lo, hi, payload in self.intervals[position]
+                         if lo <= end and hi >= start)
+        return found
+
+    def overlapping(self, start, end):
+        """
+        (position, payload) for every interval overlapping start to
+        end, in position order
+        """
+        found = [(e[2], e[3]) for e in self.search(start, end)]
+        found.sort(key=itemgetter(0))
+        return found
+
+    def positions_overlapping(self, start, end):
+        """
+        positions with an interval overlapping start to end, in order
+        """
+        return sorted(set(e[2] for e in self.search(start, end)))
+
+
+def build_interval_tree(entries):
+    """
+    centered interval tree over (lo, hi, ...) entries. Each node is
+    (center, entries containing center sorted by lo, their lo values,
+    the same sorted by hi, their hi values, left subtree, right subtree)
+    """
+    if not entries:
+        return None
+    endpoints = sorted([e[0] for e in entries] + [e[1] for e in entries])
+    center = endpoints[len(endpoints) // 2]
+    left = [e for e in entries if e[1] < center]
+    right = [e for e in entries if e[0] > center]
+    here = [e for e in entries if e[0] <= center <= e[1]]
+    by_lo = sorted(here, key=itemgetter(0))
+    by_hi = sorted(here, key=itemgetter(1))
+    return (center,
+            by_lo, [e[0] for e in by_lo],
+            by_hi, [e[1] for e in by_hi],
+            build_interval_tree(left),
+            build_interval_tree(right))
+
+
+def search_interval_tree(tree, start, end):
+    """
+    entries in tree overlapping start to end
+    """
+    found = []
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if node is None:
+            continue
+        center, by_lo, los, by_hi, his, left, right = node
+        if end < center:
+            # everything here ends after end, so overlaps if it starts
+            # by end
+            found.extend(by_lo[:bisect_right(los, end)])
+            nodes.append(left)
+        elif start > center:
+            found.extend(by_hi[bisect_left(his, start):])
+            nodes.append(right)
+        else:
+            found.extend(by_lo)
+            nodes.append(left)
+            nodes.append(right)
+    return found
@@ -0,0 +1,160 @@
+"""
+Fuzzy matching of names, for merging Popolos
+
+Names are compared by the Dice coefficient of their character
+trigrams. Rather than scoring every pair, candidates are found through
+an index of trigrams (blocking): two names can only reach the threshold
+if they share one of the rarer trigrams of each, so only those are
+indexed and only names sharing one are scored.
+
+    from popolo_data.matcher import FuzzyNameMatcher
+    merged = ours.merge(theirs,
+                        unique_on={"persons": FuzzyNameMatcher(0.85)})
+
+"""
+import math
+import re
+
+from .indexes import normalize_name
+
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def name_key(name):
+    """
+    normalized name (see normalize_name) without punctuation, with its
+    words sorted - so "Truman, Harry" and "harry truman" are equal
+    """
+    words = NON_WORD.sub(u" ", normalize_name(name)).split()
+    return u" ".join(sorted(words))
+
+
+def trigrams(key):
+    padded = u"  " + key + u" "
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class FuzzyNameMatcher(object):
+    """
+    unique_on strategy for PopoloCollection.merge that treats objects
+    as the same if their names are similar enough.
+
+    Each object in the other collection is paired with at most one of
+    ours (and vice versa): pairs are taken best score first, and
+    nothing scoring below threshold is paired.
+    """
+
+    def __init__(self, threshold=0.9, attr="name"):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be between 0 and 1")
+        self.threshold = threshold
+        self.attr = attr
+
+    def __repr__(self):
+        return "{0}({1}, attr={2!r})".format(
+            self.__class__.__name__, self.threshold, self.attr)
+
+    def min_overlap(self, size):
+        """
+        the fewest trigrams a set of size can share with another and
+        still reach the threshold
+        """
+        t = self.threshold
+        return int(math.ceil(t * size / (2 - t) - 1e-9))
+
+    def prefix(self, grams, frequency):
+        """
+        the rarest trigrams of grams - any name reaching the threshold
+        with this one shares at least one of them
+        """
+        ordered = sorted(grams, key=lambda g: (frequency.get(g, 0), g))
+        return ordered[:len(ordered) - self.min_overlap(len(ordered)) + 1]
+
+    def pairs(self, our_names, their_names):
+        """
+        (score, their position, our position) for every pair of names
+        scoring at least threshold, best first. Names that are None
+        are never matched.
+
+        Names that are the same once normalized (see name_key) score 1,
+        and aren't compared with anything else.
+        """
+        # each distinct key is scored once
+        our_positions = {}
+        for i, name in enumerate(our_names):
+            if name:
+                our_positions.setdefault(name_key(name), []).append(i)
+        our_keys = list(our_positions)
+        our_grams = [trigrams(k) for k in our_keys]
+        their_keys = [name_key(n) if n else None for n in their_names]
+        their_grams = {}
+        for key in their_keys:
+            if key is not None and key not in our_positions \
+                    and key not in their_grams:
+                their_grams[key] = trigrams(key)
+
+        frequency = {}
+        for grams in our_grams + list(their_grams.values()):
+            for g in grams:
+                frequency[g] = frequency.get(g, 0) + 1
+
+        blocks = {}
+        for k, grams in enumerate(our_grams):
+            for g in self.prefix(grams, frequency):
+                blocks.setdefault(g, []).append(k)
+
+        t = self.threshold
+        our_sizes = [len(grams) for grams in our_grams]
+        scored = {}
+        for key, grams in their_grams.items():
+            candidates = set()
+            for g in self.prefix(grams, frequency):
+                candidates.update(blocks.get(g, ()))
+            size = len(grams)
+            # sizes too different to reach the threshold, whatever the
+            # overlap
+            smallest = t * size / (2 - t)
+            largest = size * (2 - t) / t
+            matches = []
+            for k in candidates:
+                other_size = our_sizes[k]
+                if other_size < smallest or other_size > largest:
+                    continue
+                score = 2.0 * len(grams & our_grams[k]) / (size + other_size)
+                if score >= t:
+                    matches.append((score, our_keys[k]))
+            scored[key] = matches
+
+        found = []
+        for j, key in enumerate(their_keys):
+            if key is None:
+                continue
+            if key in our_positions:
+                matches = [(1.0, key)]
+            else:
+                matches = scored[key]
+            for score, our_key in matches:
+                found.extend((score, j, i) for i in our_positions[our_key])
+        found.sort(key=lambda f: (-f[0], f[1], f[2]))
+        return found
+
+    def keyed(self, ours, theirs):
+        """
+        ([(key, object)], [(key, object)]) for the objects of ours and
+        theirs, in order. Paired objects share a key.
+        """
+        ours = list(ours)
+        theirs = list(theirs)
+        our_keys = [(("ours", i), o) for i, o in enumerate(ours)]
+        their_keys = [(("theirs", j), o) for j, o in enumerate(theirs)]
+        paired_ours = set()
+        paired_theirs = set()
+        for score, j, i in self.pairs(
+                [getattr(o, self.attr) for o in ours],
+                [getattr(o, self.attr) for o in theirs]):
+            if i in paired_ours or j in paired_theirs:
+                continue
+            paired_ours.add(i)
+            paired_theirs.add(j)
+            their_keys[j] = (("ours", i), theirs[j])
+        return our_keys, their_keys
@@ -0,0 +1,135 @@
+"""
+Reports on merges of Popolos
+
+Popolo.merge and Popolo.merge_many record what they did in a
+MergeReport, kept on the result as merge_report:
+
+    merged = ours.merge(theirs)
+    for collection in merged.merge_report.collections:
+        print(collection.name, collection.input_counts,
+              collection.output_count, len(collection.contested))
+
+"""
+from timeit import default_timer
+
+
+class Contest(object):
+    """
+    two objects matched on key - winner (the index of the source it
+    came from) kept the object with keep_id, and loser's object
+    (lose_id) was absorbed into it.
+    """
+
+    __slots__ = ("key", "winner", "loser", "keep_id", "lose_id")
+
+    def __init__(self, key, winner, loser, keep_id, lose_id):
+        self.key = key
+        self.winner = winner
+        self.loser = loser
+        self.keep_id = keep_id
+        self.lose_id = lose_id
+
+    def __repr__(self):
+        return "<Contest: {0!r} source {1} over {2}>".format(
+            self.key, self.winner, self.loser)
+
+    def as_dict(self):
+        return {"key": self.key, "winner": self.winner,
+                "loser": self.loser, "keep_id": self.keep_id,
+                "lose_id": self.lose_id}
+
+
+class CollectionMergeReport(object):
+    """
+    what happened merging one collection
+    """
+
+    def __init__(self, name, unique_on):
+        self.name = name
+        self.unique_on = unique_on
+        self.input_counts = []
+        self.output_count = 0
+        self.contested = []
+        self.ids_to_change = []
+        self.timings = {}
+
+    def __repr__(self):
+        return "<CollectionMergeReport: {0}>".format(self.name)
+
+    def __str__(self):
+        msg = "merging {0} on {1}: {2} = {3}. {4} ids to change."
+        return msg.format(self.name, self.unique_on,
+                          " + ".join(str(n) for n in self.input_counts),
+                          self.output_count, len(self.ids_to_change))
+
+    def wins(self):
+        """
+        number of contests won by each source, by index
+        """
+        counts = [0] * len(self.input_counts)
+        for contest in self.contested:
+            counts[contest.winner] += 1
+        return counts
+
+    def as_dict(self):
+        return {"name": self.name,
+                "unique_on": repr(self.unique_on),
+                "input_counts": list(self.input_counts),
+                "output_count": self.output_count,
+                "contested": [c.as_dict() for c in self.contested],
+                "ids_to_change": [list(x) for x in self.ids_to_change],
+                "timings": dict(self.timings)}
+
+
+class MergeReport(object):
+    """
+    what happened in a merge - a CollectionMergeReport per collection,
+    in the order they were merged, the combined id remap and the time
+    (in seconds) spent in each phase.
+    """
+
+    def __init__(self):
+        self.collections = []
+        self.remap = {}
+        self.timings = {}
+
+    def __repr__(self):
+        return "<MergeReport: {0}>".format(
+            ", ".join(c.name for c in self.collections))
+
+    def __str__(self):
+        return "\n".join(str(c) for c in self.collections)
+
+    def __getitem__(self, name):
+        for collection in self.collections:
+            if collection.name == name:
+                return collection
+        raise KeyError(name)
+
+    def add_collection(self, name, unique_on):
+        collection = CollectionMergeReport(name, unique_on)
+        self.collections.append(collection)
+        return collection
+
+    def as_dict(self):
+        return {"collections": [c.as_dict() for c in self.collections],
+                "remap": dict(self.remap),
+                "timings": dict(self.timings)}
+
+
+class timed(object):
+    """
+    context manager adding the time spent in it to timings[phase]
+    """
+
+    def __init__(self, timings, phase):
+        self.timings = timings
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = default_timer() - self.start
+        self.timings[self.phase] = self.timings.get(self.phase, 0) + elapsed
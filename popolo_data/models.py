@@ -6,6 +6,7 @@ Classes to access items inside Popolo Collections
 import json
 import re
 import hashlib
+from copy import deepcopy
 import unidecode
 from six.moves.urllib_parse import urlsplit
 import six
@@ -19,11 +20,22 @@ from .base import Attribute, IdentiferAttribute, DateAttribute, \
 safe_property = property #we define an attribute of person as 'property'
 
 
+def _name_range(name_object):
+    return (name_object.get('start_date') or '0001-01-01',
+            name_object.get('end_date') or '9999-12-31')
+
 def _is_name_current_at(name_object, date_string):
-    start_range = name_object.get('start_date') or '0001-01-01'
-    end_range = name_object.get('end_date') or '9999-12-31'
+    start_range, end_range = _name_range(name_object)
     return date_string >= start_range and date_string <= end_range
 
+def historic_name_ranges(other_names):
+    """
+    (start, end, name) for each of other_names with an end_date - the
+    names Person.name_at chooses between. Dates are compared as strings.
+    """
+    return [_name_range(n) + (n['name'],)
+            for n in other_names if n.get('end_date')]
+
 def extract_twitter_username(username_or_url):
     split_url = urlsplit(username_or_url)
     if split_url.netloc == 'twitter.com':
@@ -40,6 +52,9 @@ def unique_preserving_order(sequence):
 
 
 class Person(PopoloObject):
+
+    __slots__ = ()
+
     id = Attribute()
     email = Attribute()
     gender = Attribute()
@@ -71,11 +86,7 @@ class Person(PopoloObject):
     fax_all = ContactAttribute(attr="fax",allow_multiple=True)
 
     def get_identifier(self,scheme):
-        rel = [x for x in self.identifiers if x["scheme"] == scheme]
-        if len(rel) == 0:
-            return None
-        else:
-            return rel[0]["identifier"]
+        return self.identifier_value(scheme)
 
     @safe_property
     def twitter(self):
@@ -109,14 +120,7 @@ class Person(PopoloObject):
 
     @safe_property
     def memberships(self):
-        
-        from .collections import MembershipCollection
-        
-        membership_lists = [
-            m.data for m in self.all_popolo.memberships
-            if m.person_id == self.id
-        ]
-        return MembershipCollection(membership_lists,self.all_popolo)
+        return self.all_popolo.memberships.filter(person_id=self.id)
 
     def name_at(self, particular_date):
         historic_names = [n for n in self.other_names if n.get('end_date')]
@@ -141,13 +145,16 @@ class Person(PopoloObject):
     
         for n in other.other_names:
             if n["name"] not in our_names:
-                self.other_names.append(n)
+                self.other_names.append(deepcopy(n))
+                self.data_changed("other_names")
                 
         if not self.gender and other.gender:
             self.gender = other.gender
 
 class Organization(PopoloObject):
-    
+
+    __slots__ = ()
+
     id = Attribute()
     name = Attribute()
     wikidata = IdentiferAttribute()
@@ -161,7 +168,9 @@ class Organization(PopoloObject):
     links = Attribute(default=[])
 
 class Membership(CurrentMixin, PopoloObject):
-    
+
+    __slots__ = ("_id_cache", "_key_cache")
+
     role = Attribute()
     source = Attribute()
     person_id = Attribute()
@@ -181,25 +190,43 @@ class Membership(CurrentMixin, PopoloObject):
     start_date = DateAttribute(default=ApproxDate.PAST)
     end_date = DateAttribute(default=ApproxDate.FUTURE)
 
+    id_fields = ("person_id", "organization_id", "area_id", "post_id",
+                 "legislative_period_id", "on_behalf_of_id")
+
+    def __init__(self, data=None, all_popolo=None, **kwargs):
+        # memoized id and key_for_hash, with the values they were made from
+        self._id_cache = None
+        self._key_cache = None
+        super(Membership, self).__init__(data, all_popolo, **kwargs)
+
+    def data_changed(self, key):
+        if key in self.id_fields:
+            self._id_cache = None
+        self._key_cache = None
+        super(Membership, self).data_changed(key)
+
     @safe_property
     def id(self):
         """
         returns a comparable id
+        
+        This is memoized - the cache is dropped when one of the id_fields
+        is set, and the fields are also checked against the ones the id
+        was made from in case self.data was changed directly.
         """
+        get = self.data.get
+        combo = tuple(get(x) for x in self.id_fields)
+        cached = self._id_cache
+        if cached is not None and cached[0] == combo:
+            return cached[1]
 
         m = hashlib.sha256()
         
-        combo = [self.person_id,
-                 self.organization_id,
-                 self.area_id,
-                 self.post_id,
-                 self.legislative_period_id,
-                 self.on_behalf_of_id]
-        
-        combo = [unidecode.unidecode(x).encode("utf-8") for x in combo if x]
-        combo = b"".join(combo)
-        m.update(combo)
-        return m.hexdigest()
+        parts = [unidecode.unidecode(x).encode("utf-8") for x in combo if x]
+        m.update(b"".join(parts))
+        digest = m.hexdigest()
+        self._id_cache = (combo, digest)
+        return digest
 
 
     @safe_property
@@ -250,14 +277,27 @@ class Membership(CurrentMixin, PopoloObject):
 
     @safe_property
     def key_for_hash(self):
-        return json.dumps(self.data, sort_keys=True)
+        """
+        memoized like id - a shallow copy of self.data is kept to
+        check against. Call data_changed after changing nested values
+        (e.g. appending to a list) in place.
+        """
+        cached = self._key_cache
+        if cached is not None and cached[0] == self.data:
+            return cached[1]
+        data = dict(self.data)
+        key = json.dumps(data, sort_keys=True)
+        self._key_cache = (data, key)
+        return key
     
     def __hash__(self):
         return hash(self.key_for_hash)
 
 
 class Area(PopoloObject):
-    
+
+    __slots__ = ()
+
     id = Attribute()
     name = Attribute()
     type = Attribute()
@@ -266,14 +306,12 @@ class Area(PopoloObject):
     wikidata = IdentiferAttribute()
 
     def get_identifier(self,scheme):
-        rel = [x for x in self.identifiers if x["scheme"] == scheme]
-        if len(rel) == 0:
-            return None
-        else:
-            return rel[0]["identifier"]
+        return self.identifier_value(scheme)
 
 class Post(PopoloObject):
-    
+
+    __slots__ = ()
+
     id = Attribute()
     label = Attribute()
     organization_id = Attribute()
@@ -281,6 +319,9 @@ class Post(PopoloObject):
 
 
 class Event(CurrentMixin, PopoloObject):
+
+    __slots__ = ()
+
     id = Attribute()
     name = Attribute()
     classification = Attribute()
@@ -292,10 +333,5 @@ class Event(CurrentMixin, PopoloObject):
 
     @property
     def memberships(self):
-        from .collections import MembershipCollection
-        
-        memberships_list = [
-            m.data for m in self.all_popolo.memberships
-            if m.legislative_period_id == self.id
-        ]
-        return MembershipCollection(memberships_list, self.all_popolo)
+        return self.all_popolo.memberships.filter(
+            legislative_period_id=self.id)
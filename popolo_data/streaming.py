@@ -0,0 +1,165 @@
+"""
+Incremental reading of large Popolo JSON files
+
+Popolo files are a single object whose values are (mostly) arrays of
+records. Rather than parsing the whole document into memory, the
+reader here walks the top level of the document itself and decodes one
+record at a time, reading the file in chunks as it goes.
+
+"""
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRUCTURE = re.compile(r'["\[\]{}]')
+STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+VALUE_END = " \t\n\r,]}"
+
+
+class StreamError(ValueError):
+    pass
+
+
+class JSONStreamReader(object):
+    """
+    reads a JSON object from fileobj, yielding the members of its
+    top-level arrays one at a time.
+    """
+
+    def __init__(self, fileobj, chunk_size=65536):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read_more(self):
+        """
+        add another chunk to the buffer, dropping what has been consumed.
+        Returns False at the end of the file.
+        """
+        if self.eof:
+            return False
+        chunk = self.fileobj.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        next non-whitespace character, or None at the end of the file
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.read_more():
+                return None
+
+    def expect(self, characters):
+        c = self.peek()
+        if c is None or c not in characters:
+            msg = "Expected one of {0!r} at {1!r}"
+            raise StreamError(msg.format(
+                characters, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return c
+
+    def decode(self):
+        """
+        decode the complete JSON value at the current position
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.read_more():
+                    continue
+                raise
+            # a number cut off at the end of the buffer decodes as its
+            # prefix ("2.5e" as 2.5, say), so only a value followed by
+            # whitespace or the end of its container is complete
+            if (end == len(self.buffer) or
+                    self.buffer[end] not in VALUE_END) and self.read_more():
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """
+        move past the JSON value at the current position without
+        building it
+        """
+        c = self.peek()
+        if c not in "[{":
+            self.decode()
+            return
+        depth = 0
+        while True:
+            match = STRUCTURE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self.read_more():
+                    raise StreamError("Unexpected end of file")
+                continue
+            c = match.group()
+            if c == '"':
+                end = STRING_END.match(self.buffer, match.end())
+                if end is None:
+                    # string runs past the end of the buffer
+                    self.pos = match.start()
+                    if not self.read_more():
+                        raise StreamError("Unterminated string")
+                    continue
+                self.pos = end.end()
+                continue
+            self.pos = match.end()
+            if c in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_array(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+    def iter_records(self, wanted=None):
+        """
+        yields (key, record) for each record in the document's top-level
+        arrays. Only keys in wanted are parsed, if it is given - the
+        other values are skipped over.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise StreamError("Expected a key at {0!r}".format(
+                    self.buffer[self.pos:self.pos + 20]))
+            key = self.decode()
+            self.expect(":")
+            if (wanted is None or key in wanted) and self.peek() == "[":
+                for record in self.iter_array():
+                    yield key, record
+            else:
+                self.skip()
+            if self.expect(",}") == "}":
+                return
+
+
+def iter_records(fileobj, wanted=None):
+    return JSONStreamReader(fileobj).iter_records(wanted)
@@ -0,0 +1,120 @@
+from datetime import date
+from unittest import TestCase
+
+import pytest
+
+from .helpers import example_file
+from .test_membership import EXAMPLE_MULTIPLE_MEMBERSHIPS
+
+from popolo_data.importer import Popolo
+from popolo_data.collections import (CollectionView, MembershipCollection,
+    MembershipCollectionView)
+from popolo_data.models import Membership
+
+
+class TestCollectionView(TestCase):
+
+    def test_filter_shares_objects(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            starfleet = popolo.memberships.filter(organization_id="starfleet")
+            assert isinstance(starfleet, CollectionView)
+            assert isinstance(starfleet, MembershipCollectionView)
+            assert len(starfleet) == 3
+            assert starfleet[0] is popolo.memberships[0]
+
+    def test_chained_filter(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            view = popolo.memberships.filter(organization_id="starfleet") \
+                .filter(person_id="SC-231-427")
+            assert view.parent is popolo.memberships
+            assert [m.person_id for m in view] == ["SC-231-427"]
+            empty = popolo.persons.filter(id="SP-937-215") \
+                .filter(id="SC-231-427")
+            assert len(empty) == 0
+
+    def test_view_follows_collection(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            riker = popolo.persons[1]
+            view = riker.memberships
+            assert len(view) == 1
+            popolo.add(Membership(person_id=riker.id,
+                                  organization_id="gardening-club"))
+            assert len(view) == 2
+            popolo.memberships[0].person_id = riker.id
+            assert len(view) == 3
+            assert view.get(organization_id="gardening-club").person == riker
+
+    def test_where(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            view = popolo.persons.first.memberships \
+                .where(lambda m: m.organization_id.startswith("garden"))
+            assert len(view) == 1
+
+    def test_materialize_copies(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            view = popolo.persons.first.memberships
+            copied = view.materialize()
+            assert type(copied) == MembershipCollection
+            assert len(copied) == 3
+            assert copied[0] == view[0]
+            assert copied[0] is not view[0]
+            copied[0].person_id = "someone-else"
+            assert view[0].person_id == "SP-937-215"
+            assert len(view) == 3
+
+    def test_views_are_read_only(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            with pytest.raises(TypeError):
+                popolo.persons.first.memberships.add(Membership())
+
+    def test_collection_lookups_on_views(self):
+        popolo = Popolo({
+            "persons": [
+                {"id": "a", "name": "Jean-Luc Picard", "gender": "male",
+                 "identifiers": [{"scheme": "sf", "identifier": "1"}],
+                 "other_names": [{"name": "Locutus",
+                                  "start_date": "2366-01-01",
+                                  "end_date": "2367-01-01"}]},
+                {"id": "b", "name": "Beverly Crusher", "gender": "female",
+                 "identifiers": [{"scheme": "sf", "identifier": "1"}]},
+                {"id": "c", "name": "Beverly Picard", "gender": "female"}],
+            "events": [
+                {"id": "e1", "classification": "general election",
+                 "start_date": "2360", "end_date": "2360",
+                 "identifiers": [{"scheme": "wd", "identifier": "Q1"}]},
+                {"id": "e2", "classification": "legislative period",
+                 "start_date": "2360", "end_date": "2364",
+                 "identifiers": [{"scheme": "wd", "identifier": "Q1"}]}],
+        })
+        women = popolo.persons.filter(gender="female")
+        assert [p.id for p in women.by_identifier("sf", "1")] == ["b"]
+        assert [p.id for p in women.by_name("beverly picard")] == ["c"]
+        assert [p.id for p in women.by_name_prefix("bev")] == ["b", "c"]
+        assert women.by_name("Jean-Luc Picard") == []
+        men = popolo.persons.filter(gender="male")
+        assert men.names_at("2366-06-01") == {"a": "Locutus"}
+        assert women.names_at("2366-06-01") == {
+            "b": "Beverly Crusher", "c": "Beverly Picard"}
+
+        elections = popolo.elections
+        assert [e.id for e in elections.by_identifier("wd", "Q1")] == ["e1"]
+        periods = popolo.events.filter(classification="legislative period")
+        earliest, latest = periods.date_bounds()
+        assert len(earliest) == 2
+        assert periods.positions_overlapping(
+            date(2362, 1, 1), date(2362, 1, 1)) == [1]
+        assert [e.id for e in periods.current_at(date(2360, 6, 1))] == \
+            ["e2"]
+        assert len(elections.legislative_periods) == 0
+
+    def test_views_have_no_collection_state(self):
+        popolo = Popolo({"persons": [{"id": "a", "name": "Data"}]})
+        view = popolo.persons.filter(name="Data")
+        for name in ("merge", "merge_many", "remap_ids", "objects"):
+            assert not hasattr(view, name)
@@ -0,0 +1,101 @@
+from datetime import date
+import json
+from unittest import TestCase
+
+from .helpers import example_file
+from .test_membership import EXAMPLE_MULTIPLE_MEMBERSHIPS, DATED_MEMBERSHIPS
+
+from popolo_data.importer import Popolo
+from popolo_data.columnar import (ColumnarPopolo,
+    ColumnarMembershipCollection)
+from popolo_data.models import Membership
+
+
+class TestColumnarMemberships(TestCase):
+
+    def test_loads_into_columns(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = ColumnarPopolo.from_filename(fname)
+            memberships = popolo.memberships
+            assert isinstance(memberships, ColumnarMembershipCollection)
+            assert len(memberships) == 4
+            # one code per distinct id
+            assert len(memberships.codes.values) == 5
+            assert list(memberships.id_columns["person_id"]) == [1, 1, 1, 4]
+
+    def test_same_values_as_popolo(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            columnar = ColumnarPopolo.from_filename(fname)
+            popolo = Popolo.from_filename(fname)
+        assert columnar.json_data == popolo.json_data
+        for a, b in zip(columnar.memberships, popolo.memberships):
+            assert a == b
+            assert a.id == b.id
+            assert a.start_date == b.start_date
+            assert a.person == b.person
+
+    def test_unparseable_date_kept(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = ColumnarPopolo.from_filename(fname)
+            memberships = popolo.memberships
+            assert memberships.extras[2] == {"end_date": "2327-11-31"}
+            assert memberships.raw_data()[2]["end_date"] == "2327-11-31"
+
+    def test_person_memberships(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = ColumnarPopolo.from_filename(fname)
+            picard = popolo.persons.first
+            assert len(picard.memberships) == 3
+            assert picard.memberships[1] is popolo.memberships[1]
+            starfleet = popolo.memberships.filter(
+                organization_id="starfleet", person_id="SP-937-215")
+            assert len(starfleet) == 2
+            assert len(popolo.memberships.filter(person_id="nobody")) == 0
+
+    def test_set_writes_to_columns(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = ColumnarPopolo.from_filename(fname)
+            riker = popolo.persons[1]
+            m = popolo.memberships[0]
+            m.person_id = "SC-231-427"
+            m.end_date = "2330"
+            assert m.data["person_id"] == "SC-231-427"
+            assert popolo.memberships.end_latest[0] == \
+                date(2330, 12, 31).toordinal()
+            assert len(riker.memberships) == 2
+            raw = json.loads(m.json)
+            assert raw["person_id"] == "SC-231-427"
+            assert raw["end_date"] == "2330"
+
+    def test_add_membership(self):
+        popolo = ColumnarPopolo()
+        m = Membership(person_id="SC-231-427", role="captain",
+                       start_date="2379")
+        popolo.add(m)
+        assert m.data["role"] == "captain"
+        assert popolo.memberships.raw_data() == [
+            {"person_id": "SC-231-427", "role": "captain",
+             "start_date": "2379"}]
+        assert popolo.memberships.first is m
+        assert m.start_date.earliest_date == date(2379, 1, 1)
+
+    def test_add_shared_membership(self):
+        source = Popolo({"memberships": [{"person_id": "a1",
+                                          "organization_id": "x"}]})
+        m = source.shared_copy().memberships[0]
+        popolo = ColumnarPopolo()
+        popolo.add(m)
+        m.person_id = "zz"
+        assert m.person_id == "zz"
+        assert popolo.json_data["memberships"][0]["person_id"] == "zz"
+        assert source.memberships[0].person_id == "a1"
+
+    def test_current_at_matches_popolo(self):
+        columnar = ColumnarPopolo(DATED_MEMBERSHIPS)
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        for when in (date(2009, 1, 1), date(2012, 1, 1), date(2014, 6, 20)):
+            assert columnar.memberships.current_at(when).raw_data() == \
+                popolo.memberships.current_at(when).raw_data()
+        view = columnar.memberships.filter(organization_id="x") \
+            .current_at(date(2015, 1, 1))
+        assert [m.person_id for m in view] == ["b", "d"]
@@ -9,6 +9,7 @@ import six
 from .helpers import example_file
 
 from popolo_data.importer import Popolo
+from popolo_data.models import Membership
 
 
 EXAMPLE_EVENT_JSON = b'''
@@ -279,3 +280,55 @@ class TestEvents(TestCase):
             term = popolo.latest_term
             memberships = term.memberships
             assert len(memberships) == 2
+
+    def test_event_memberships_after_add(self):
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            term = popolo.latest_term
+            m = Membership(person_id="new-member",
+                           legislative_period_id=term.id)
+            popolo.add(m)
+            memberships = term.memberships
+            assert len(memberships) == 3
+            assert memberships[2] is m
+
+    def test_event_memberships_after_amend_ids(self):
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.amend_ids([("term/12", "term/13")])
+            term = popolo.latest_term
+            assert len(term.memberships) == 3
+            assert term.memberships[1] is popolo.memberships[1]
+
+    def test_events_current_at(self):
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            current = popolo.events.current_at(date(2015, 3, 1))
+            assert [e.id for e in current] == ['term/12', 'Q16412592']
+            assert [e.id for e in popolo.events.current_at(
+                date(2020, 1, 1))] == ['term/13']
+            assert len(popolo.events.current_at(date(1980, 1, 1))) == 0
+            for event in popolo.events:
+                assert (event in current) == event.current_at(
+                    date(2015, 3, 1))
+
+    def test_legislative_periods_overlapping(self):
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            terms = popolo.legislative_periods.overlapping(
+                date(2015, 1, 1), date(2015, 12, 31))
+            assert [t.id for t in terms] == ['term/12', 'term/13']
+            terms = popolo.legislative_periods.overlapping(
+                date(2015, 3, 24), date(2015, 3, 29))
+            assert len(terms) == 0
+
+    @patch('popolo_data.collections.date')
+    def test_events_current(self, mock_date):
+        mock_date.today.return_value = date(2013, 1, 1)
+        mock_date.min = date.min
+        mock_date.max = date.max
+        with example_file(EXAMPLE_MULTIPLE_EVENTS) as fname:
+            popolo = Popolo.from_filename(fname)
+            assert [e.id for e in popolo.events.current] == ['term/12']
+            popolo.events[0].end_date = '2012-12-31'
+            assert len(popolo.events.current) == 0
@@ -2,11 +2,28 @@ from mock import patch, Mock
 from unittest import TestCase
 
 import pytest
+import six
 from six import text_type
 
 from .helpers import example_file
 
-from popolo_data.importer import Popolo
+from popolo_data.importer import Popolo, CollectionNotLoaded
+from popolo_data.streaming import JSONStreamReader, StreamError
+from popolo_data.models import Person
+
+
+EXAMPLE_WITH_META = u'''
+{
+    "meta": {"note": "braces } and [ in \\"strings\\"", "n": [1, {"a": 2}]},
+    "persons": [
+        {"id": "1", "name": "Norma Jennings", "other_names": [{"name": "N"}]},
+        {"id": "2", "name": "Harry Truman"}
+    ],
+    "count": 12345,
+    "memberships": [],
+    "organizations": [{"id": "sheriffs", "name": "Sheriff\'s Department"}]
+}
+'''
 
 
 class TestLoading(TestCase):
@@ -29,3 +46,125 @@ class TestLoading(TestCase):
         faked_get.side_effect = lambda url: mock_response
         popolo = Popolo.from_url('http://example.org/popolo.json')
         assert popolo.persons.first.name == 'Joe Bloggs'
+
+    def test_stream_records_across_chunks(self):
+        for chunk_size in (1, 7, 64, 65536):
+            reader = JSONStreamReader(six.StringIO(EXAMPLE_WITH_META),
+                                      chunk_size=chunk_size)
+            records = list(reader.iter_records())
+            assert [k for k, r in records] == \
+                ["persons", "persons", "organizations"]
+            assert records[0][1]["other_names"] == [{"name": "N"}]
+            assert records[2][1]["name"] == "Sheriff's Department"
+
+    def test_stream_numbers_across_chunks(self):
+        document = u'{"x": 0.0, "y": -2.5e-3, "persons": [0.0, 10, 2.5E+1]}'
+        for chunk_size in range(1, len(document) + 1):
+            for wanted in (None, ["persons"]):
+                reader = JSONStreamReader(six.StringIO(document),
+                                          chunk_size=chunk_size)
+                records = list(reader.iter_records(wanted=wanted))
+                assert [r for k, r in records] == [0.0, 10, 25.0]
+
+    def test_stream_skips_unwanted(self):
+        reader = JSONStreamReader(six.StringIO(EXAMPLE_WITH_META),
+                                  chunk_size=5)
+        records = list(reader.iter_records(wanted=["organizations"]))
+        assert [r["id"] for k, r in records] == ["sheriffs"]
+
+    def test_stream_malformed(self):
+        reader = JSONStreamReader(six.StringIO(u'{"persons": [{}, {}'))
+        with pytest.raises(StreamError):
+            list(reader.iter_records())
+
+    def test_from_filename_streams(self):
+        with example_file(EXAMPLE_WITH_META.encode("utf-8")) as filename:
+            popolo = Popolo.from_filename(filename)
+            assert len(popolo.persons) == 2
+            assert len(popolo.organizations) == 1
+            assert popolo.persons.get(name="Harry Truman").id == "2"
+
+    def test_from_filename_only(self):
+        with example_file(EXAMPLE_WITH_META.encode("utf-8")) as filename:
+            popolo = Popolo.from_filename(filename, only=["organizations"])
+            assert len(popolo.organizations) == 1
+            assert [k for k, v in popolo.collections] == ["organizations"]
+            with pytest.raises(CollectionNotLoaded):
+                popolo.persons
+
+    def test_from_filename_exclude(self):
+        with example_file(EXAMPLE_WITH_META.encode("utf-8")) as filename:
+            popolo = Popolo.from_filename(filename, exclude=["persons"])
+            assert len(popolo.organizations) == 1
+            assert len(popolo.memberships) == 0
+            assert not hasattr(popolo, "persons")
+
+    def test_unknown_collection(self):
+        with pytest.raises(ValueError):
+            Popolo({}, only=["people"])
+
+    @patch('popolo_data.importer.requests.get')
+    def test_create_from_url_only(self, faked_get):
+        mock_response = Mock()
+        mock_response.json.return_value = {
+            'persons': [{'name': 'Joe Bloggs'}]
+        }
+        faked_get.side_effect = lambda url: mock_response
+        popolo = Popolo.from_url('http://example.org/popolo.json',
+                                 only=["events"])
+        assert len(popolo.events) == 0
+        with pytest.raises(CollectionNotLoaded):
+            popolo.persons.first
+
+
+EXAMPLE_IDENTIFIERS = {
+    "persons": [
+        {"id": "p1", "name": "Norma Jennings",
+         "identifiers": [{"scheme": "wikidata", "identifier": "Q1"}]},
+        {"id": "p2", "name": "Harry Truman",
+         "identifiers": [{"scheme": "wikidata", "identifier": "Q2"},
+                         {"scheme": "gss", "identifier": "E1"}]},
+    ],
+    "areas": [
+        {"id": "a1", "name": "Twin Peaks",
+         "identifiers": [{"scheme": "gss", "identifier": "E1"}]},
+    ],
+    "events": [
+        {"id": "e1", "name": "Election",
+         "identifiers": [{"scheme": "wikidata", "identifier": "Q3"}]},
+    ],
+}
+
+
+class TestIdentifierLookup(TestCase):
+
+    def test_by_identifier(self):
+        popolo = Popolo(EXAMPLE_IDENTIFIERS)
+        assert popolo.by_identifier("wikidata", "Q2") == \
+            [popolo.persons[1]]
+        assert popolo.by_identifier("gss", "E1") == \
+            [popolo.persons[1], popolo.areas[0]]
+        assert popolo.by_identifier("wikidata", "Q3") == [popolo.events[0]]
+        assert popolo.by_identifier("wikidata", "E1") == []
+        assert popolo.persons.by_identifier("gss", "E1") == \
+            [popolo.persons[1]]
+
+    def test_by_identifiers(self):
+        popolo = Popolo(EXAMPLE_IDENTIFIERS)
+        found = popolo.by_identifiers("wikidata", ["Q1", "Q3", "Q9"])
+        assert found == {"Q1": [popolo.persons[0]],
+                         "Q3": [popolo.events[0]],
+                         "Q9": []}
+
+    def test_by_identifier_follows_changes(self):
+        popolo = Popolo(EXAMPLE_IDENTIFIERS, only=["persons"])
+        assert popolo.by_identifier("wikidata", "Q1") == [popolo.persons[0]]
+        popolo.persons[0].wikidata = "Q10"
+        popolo.persons[1].del_related_values(
+            "identifiers", "scheme", "gss")
+        popolo.add(Person(id="p3", identifiers=[
+            {"scheme": "wikidata", "identifier": "Q1"}]))
+        assert popolo.by_identifier("wikidata", "Q10") == \
+            [popolo.persons[0]]
+        assert popolo.by_identifier("wikidata", "Q1") == [popolo.persons[2]]
+        assert popolo.by_identifier("gss", "E1") == []
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+import pytest
+
+from popolo_data.importer import Popolo
+from popolo_data.matcher import FuzzyNameMatcher, name_key, trigrams
+
+
+class TestFuzzyNameMatcher(TestCase):
+
+    def test_name_key(self):
+        assert name_key(u"Truman,  Harry") == name_key(u"harry TRUMAN")
+        assert name_key(u"Zoë Bäcker") == u"backer zoe"
+
+    def test_pairs(self):
+        matcher = FuzzyNameMatcher(0.8)
+        ours = ["Harry Truman", "Norma Jennings", None, "Dale Cooper"]
+        theirs = ["Cooper, Dale", "Norma Jenings", "Audrey Horne", None]
+        pairs = matcher.pairs(ours, theirs)
+        assert [(j, i) for score, j, i in pairs] == [(0, 3), (1, 1)]
+        assert pairs[0][0] == 1.0
+        assert 0.8 <= pairs[1][0] < 1.0
+
+    def test_pairs_matches_brute_force(self):
+        import random
+        rng = random.Random(2)
+        letters = "abcdefghij"
+        def name():
+            return " ".join("".join(rng.choice(letters)
+                                    for _ in range(rng.randint(2, 6)))
+                            for _ in range(2))
+        ours = [name() for _ in range(150)]
+        theirs = [n[:-1] + rng.choice(letters) for n in ours[:75]] + \
+            [name() for _ in range(75)]
+        for threshold in (0.6, 0.8, 0.95):
+            expected = set()
+            our_keys = set(name_key(a) for a in ours)
+            for j, b in enumerate(theirs):
+                for i, a in enumerate(ours):
+                    if name_key(b) in our_keys:
+                        # exact matches aren't compared further
+                        if name_key(a) == name_key(b):
+                            expected.add((j, i))
+                        continue
+                    ga, gb = trigrams(name_key(a)), trigrams(name_key(b))
+                    score = 2.0 * len(ga & gb) / (len(ga) + len(gb))
+                    if score >= threshold:
+                        expected.add((j, i))
+            found = FuzzyNameMatcher(threshold).pairs(ours, theirs)
+            assert set((j, i) for score, j, i in found) == expected
+
+    def test_bad_threshold(self):
+        with pytest.raises(ValueError):
+            FuzzyNameMatcher(0)
+
+    def test_merge_with_matcher(self):
+        ours = Popolo({
+            "persons": [{"id": "1", "name": "Harry Truman"},
+                        {"id": "2", "name": "Norma Jennings",
+                         "gender": "female"}],
+            "memberships": [{"person_id": "2", "organization_id": "diner"}],
+        })
+        theirs = Popolo({
+            "persons": [{"id": "a", "name": "Norma Jenings"},
+                        {"id": "b", "name": "Audrey Horne"}],
+            "memberships": [{"person_id": "a", "organization_id": "rr"}],
+        })
+        exact = ours.merge(theirs)
+        assert len(exact.persons) == 4
+        merged = ours.merge(theirs,
+                            unique_on={"persons": FuzzyNameMatcher(0.8)})
+        assert [p.id for p in merged.persons] == ["1", "2", "b"]
+        assert sorted(m.person_id for m in merged.memberships) == ["2", "2"]
+
+    def test_merge_unknown_collection(self):
+        with pytest.raises(ValueError):
+            Popolo().merge(Popolo(), unique_on={"people": "name"})
@@ -6,7 +6,9 @@ from mock import patch
 
 from .helpers import example_file
 
-from popolo_data.importer import Popolo
+from popolo_data.importer import Popolo, combine_id_changes
+from popolo_data.collections import MembershipCollection
+from popolo_data.models import Membership
 from approx_dates.models import ApproxDate
 
 
@@ -406,3 +408,246 @@ class TestPersonMemberships(TestCase):
             latest_starfleet_membership = \
                 starfleet_memberships.filter(start_date=date(2323, 12, 1))
             assert len(latest_starfleet_membership) == 1
+
+    def test_person_memberships_share_objects(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            person = popolo.persons.first
+            assert person.memberships[0] is popolo.memberships[0]
+
+    def test_person_memberships_follow_reassignment(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            picard, riker = popolo.persons[0], popolo.persons[1]
+            popolo.memberships[0].person_id = riker.id
+            assert len(picard.memberships) == 2
+            assert len(riker.memberships) == 2
+            assert riker.memberships[0] is popolo.memberships[0]
+
+    def test_person_memberships_after_add(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            riker = popolo.persons[1]
+            m = Membership(person_id=riker.id, organization_id="starfleet")
+            popolo.add(m)
+            assert len(riker.memberships) == 2
+            assert riker.memberships[1] is m
+
+    def test_indexes_follow_objects_added_elsewhere(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            picard, riker = popolo.persons[0], popolo.persons[1]
+            popolo.memberships.create_index("organization_id")
+            # indexes are built on first use, so use them before moving
+            assert len(riker.memberships) == 1
+            assert len(popolo.memberships.filter(organization_id="x")) == 0
+            assert popolo.persons.by_identifier("wikidata", "Q16341") == []
+            assert popolo.persons.by_name("locutus") == []
+            m = popolo.memberships[0]
+            other = Popolo()
+            other.add(m)
+            other.memberships.create_index("person_id")
+            m.person_id = riker.id
+            m.organization_id = "gardening-club"
+            assert len(picard.memberships) == 2
+            assert len(riker.memberships) == 2
+            assert popolo.memberships.filter(
+                organization_id="gardening-club")[0] is m
+            assert other.memberships.filter(person_id=riker.id)[0] is m
+            assert other.memberships[0] is m
+            # and a person's identifiers and names in both Popolos
+            other.add(picard)
+            picard.wikidata = "Q16341"
+            picard.name = "Locutus"
+            for pop in (popolo, other):
+                assert pop.persons.by_identifier("wikidata", "Q16341") == \
+                    [picard]
+                assert pop.persons.by_name("locutus") == [picard]
+                assert pop.persons.filter(name="Locutus").raw_data() == \
+                    [picard.data]
+
+    def test_id_and_key_follow_changes(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            m = popolo.memberships[0]
+            other = popolo.memberships[3]
+            original_id, original_key = m.id, m.key_for_hash
+            assert m.id == original_id
+            m.person_id = other.person_id
+            assert m.id != original_id
+            assert m.key_for_hash != original_key
+            m.person_id = "SP-937-215"
+            assert m.id == original_id
+            assert m.key_for_hash == original_key
+
+    def test_id_and_key_follow_direct_data_changes(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            m = popolo.memberships[0]
+            original_id, original_key = m.id, m.key_for_hash
+            m.data["organization_id"] = "gardening-club"
+            assert m.id != original_id
+            assert m.key_for_hash != original_key
+            m.data = {"person_id": "SP-937-215",
+                      "organization_id": "starfleet",
+                      "start_date": "2322",
+                      "end_date": "2322"}
+            assert m.id == original_id
+            assert m.key_for_hash == original_key
+
+    def test_objects_made_on_demand(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            assert len(popolo.memberships) == 4
+            assert popolo.memberships.objects == [None] * 4
+            m = popolo.memberships[1]
+            assert popolo.memberships[1] is m
+            assert m.person.name == "Jean-Luc Picard"
+            assert popolo.persons.objects[1] is None
+            assert len(popolo.persons[0].memberships) == 3
+            assert popolo.memberships.objects[3] is None
+            assert popolo.memberships.raw_data()[3]["person_id"] == \
+                "SC-231-427"
+
+    def test_memberships_have_no_dict(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            m = popolo.memberships[0]
+            m.id
+            m.start_date
+            assert not getattr(m, "__dict__", None)
+            assert m.start_date is m._start_date_parsed
+
+    def test_ids_interned_on_load(self):
+        with example_file(EXAMPLE_MULTIPLE_MEMBERSHIPS) as fname:
+            popolo = Popolo.from_filename(fname)
+            picard = popolo.persons[0]
+            for m in popolo.memberships[:3]:
+                assert m.person_id is picard.id
+            assert popolo.memberships[0].organization_id is \
+                popolo.organizations[0].id
+
+
+DATED_MEMBERSHIPS = {
+    "memberships": [
+        {"person_id": "a", "organization_id": "x",
+         "start_date": "2010", "end_date": "2014-06"},
+        {"person_id": "b", "organization_id": "x",
+         "start_date": "2014-06-15"},
+        {"person_id": "c", "organization_id": "y",
+         "end_date": "2012-01-01"},
+        {"person_id": "d", "organization_id": "x"},
+    ]
+}
+
+
+class TestMembershipDateQueries(TestCase):
+
+    def test_current_at(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        memberships = popolo.memberships
+        # '2014-06' could end on the 30th
+        current = memberships.current_at(date(2014, 6, 20))
+        assert [m.person_id for m in current] == ["a", "b", "d"]
+        for when in (date(2009, 1, 1), date(2012, 1, 1), date(2014, 7, 1)):
+            current = memberships.current_at(when)
+            assert list(current) == [m for m in memberships
+                                     if m.current_at(when)]
+
+    def test_current_at_reads_dates_without_objects(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        current = popolo.memberships.current_at(date(2011, 1, 1))
+        assert popolo.memberships.matching([], (), current.selectors) \
+            == [popolo.memberships[p] for p in (0, 2, 3)]
+        assert popolo.memberships.objects[1] is None
+
+    def test_overlapping_chains_with_filter(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        view = popolo.memberships.filter(organization_id="x") \
+            .overlapping(date(2011, 1, 1), date(2014, 12, 31))
+        assert [m.person_id for m in view] == ["a", "b", "d"]
+        view = view.overlapping(date(2015, 1, 1), date(2016, 1, 1))
+        assert [m.person_id for m in view] == ["b", "d"]
+
+    def test_current_at_follows_changes(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        current = popolo.memberships.current_at(date(2013, 1, 1))
+        assert len(current) == 2
+        popolo.memberships[3].end_date = date(2012, 12, 31)
+        popolo.add(Membership(person_id="e", start_date="2013"))
+        assert [m.person_id for m in current] == ["a", "e"]
+
+    def test_date_index_matches_scan(self):
+        import random
+        rng = random.Random(4)
+        records = []
+        for i in range(300):
+            record = {"person_id": str(i)}
+            if rng.random() < 0.8:
+                record["start_date"] = "{0}-{1:02d}".format(
+                    rng.randint(1990, 2010), rng.randint(1, 12))
+            if rng.random() < 0.8:
+                record["end_date"] = str(rng.randint(1995, 2020))
+            records.append(record)
+        popolo = Popolo({"memberships": records})
+        memberships = popolo.memberships
+        def check():
+            for year in (1989, 1995, 2000, 2004, 2012, 2021):
+                when = date(year, 6, 1)
+                assert list(memberships.current_at(when)) == \
+                    [m for m in memberships if m.current_at(when)]
+        check()
+        for i in range(100):
+            popolo.add(Membership(person_id="new" + str(i),
+                                  start_date=str(rng.randint(1990, 2010))))
+            memberships[rng.randrange(len(memberships))].end_date = \
+                str(rng.randint(1995, 2020))
+            if i % 25 == 0:
+                check()
+        check()
+
+
+class TestAmendIds(TestCase):
+
+    def test_combine_id_changes(self):
+        assert combine_id_changes([("a", "b"), ("b", "c"), ("d", "d")]) \
+            == {"a": "c", "b": "c"}
+        assert combine_id_changes([("a", "b"), ("b", "a")]) == {"b": "a"}
+        assert combine_id_changes([("a", "b"), ("c", "a")]) == \
+            {"a": "b", "c": "a"}
+
+    def test_amend_ids_only_touches_referencing_objects(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        popolo.amend_ids([("x", "z"), ("a", "aa"), ("aa", "A")])
+        memberships = popolo.memberships
+        assert [m is None for m in memberships.objects] == \
+            [False, False, True, False]
+        assert [m.organization_id for m in memberships] == \
+            ["z", "z", "y", "z"]
+        assert memberships[0].person_id == "A"
+        assert memberships.filter(person_id="a").first is None
+        assert memberships.filter(person_id="A").first is memberships[0]
+
+    def test_amend_ids_updates_key_lookup(self):
+        popolo = Popolo(DATED_MEMBERSHIPS)
+        memberships = popolo.memberships
+        lookup = memberships.lookup_from_key
+        old_key = memberships[1].key_for_hash
+        assert lookup[old_key] is memberships[1]
+        popolo.amend_ids([("b", "B")])
+        assert old_key not in lookup
+        assert lookup[memberships[1].key_for_hash] is memberships[1]
+
+    def test_amend_ids_inherited_attributes(self):
+        class PartyMembership(Membership):
+            __slots__ = ()
+
+        class PartyMembershipCollection(MembershipCollection):
+            object_class = PartyMembership
+
+        popolo = Popolo()
+        popolo.memberships = PartyMembershipCollection(
+            [{"person_id": "a", "on_behalf_of_id": "p"}], popolo)
+        popolo.amend_ids([("a", "b"), ("p", "q")])
+        m = popolo.memberships[0]
+        assert (m.person_id, m.on_behalf_of_id) == ("b", "q")
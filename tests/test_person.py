@@ -9,6 +9,8 @@ import six
 from .helpers import example_file
 from approx_dates.models import ApproxDate
 from popolo_data.importer import Popolo
+from popolo_data.base import RELATED_SCAN_LIMIT
+from popolo_data.indexes import NameIndex
 from popolo_data.models import Person
 
 
@@ -138,6 +140,28 @@ class TestPersons(TestCase):
             person = popolo.persons.get(name='Harry Truman')
             assert person.id == '2'
 
+    def test_get_of_people_with_index(self):
+        with example_file(EXAMPLE_TWO_PEOPLE) as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.persons.create_index('id')
+            person = popolo.persons.get(id='2')
+            assert person is popolo.persons[1]
+            with pytest.raises(Person.DoesNotExist):
+                popolo.persons.get(id='3')
+            popolo.add(Person(id='3', name='Dale Cooper'))
+            assert popolo.persons.get(id='3').name == 'Dale Cooper'
+
+    def test_filter_of_people_with_index_after_change(self):
+        with example_file(EXAMPLE_TWO_PEOPLE) as fname:
+            popolo = Popolo.from_filename(fname)
+            popolo.persons.create_index('national_identity')
+            popolo.persons[0].national_identity = 'Canadian'
+            americans = popolo.persons.filter(national_identity='American')
+            assert [p.id for p in americans] == ['2']
+            canadians = popolo.persons.filter(national_identity='Canadian',
+                                              name='Norma Jennings')
+            assert [p.id for p in canadians] == ['1']
+
     def test_get_person_with_image_and_wikidata(self):
         # n.b. this is actually the Wikidata ID for the actor who
         # played Harry Truman; I couldn't find one for the character.
@@ -630,3 +654,145 @@ class TestPersons(TestCase):
             person = popolo.persons.first
             assert not (person == "a string, not a person")
             assert (person != "a string not a person")
+
+    def test_names_at(self):
+        popolo = Popolo({"persons": [
+            {"id": "bob", "name": "Bob",
+             "other_names": [{"name": "Robert",
+                              "start_date": "1989-01-01",
+                              "end_date": "1999-12-31"},
+                             {"name": "Bobby"}]},
+            {"id": "alice", "name": "Alice"},
+        ]})
+        assert popolo.persons.names_at(date(1990, 6, 1)) == \
+            {"bob": "Robert", "alice": "Alice"}
+        assert popolo.persons.names_at(date(2000, 1, 1)) == \
+            {"bob": "Bob", "alice": "Alice"}
+        for when in (date(1990, 6, 1), date(2000, 1, 1)):
+            names = popolo.persons.names_at(when)
+            for person in popolo.persons:
+                assert names[person.id] == person.name_at(when)
+
+    def test_names_at_follows_changes(self):
+        popolo = Popolo({"persons": [{"id": "bob", "name": "Bob"}]})
+        assert popolo.persons.names_at(date(1990, 1, 1)) == {"bob": "Bob"}
+        bob = popolo.persons.first
+        bob.other_names = [{"name": "Robert", "end_date": "1999-12-31"}]
+        other = Person(id="alice", name="Alice", other_names=[
+            {"name": "Al", "start_date": "1980", "end_date": "1995"}])
+        popolo.add(other)
+        assert popolo.persons.names_at(date(1990, 1, 1)) == \
+            {"bob": "Robert", "alice": "Al"}
+        bob.absorb(Person(other_names=[
+            {"name": "Bobby", "start_date": "1985", "end_date": "1991"}]))
+        with pytest.raises(Exception) as excinfo:
+            popolo.persons.names_at(date(1990, 1, 1))
+        assert "Multiple names for <Person: Bob>" in str(excinfo)
+
+    def test_identifiers_by_scheme(self):
+        person = Person(name="Bob", identifiers=[
+            {"scheme": "wikidata", "identifier": "Q1"},
+            {"scheme": "gss", "identifier": "E1"},
+            {"scheme": "wikidata", "identifier": "Q2"}])
+        assert person.identifiers_by_scheme() == {
+            "wikidata": ["Q1", "Q2"], "gss": ["E1"]}
+        assert person.identifier_values("wikidata") == ["Q1", "Q2"]
+        assert person.get_identifier("gss") == "E1"
+
+    def test_related_values_follow_changes(self):
+        person = Person(name="Bob", links=[
+            {"note": "facebook", "url": "https://facebook.com/bob"}])
+        assert person.facebook == "https://facebook.com/bob"
+        person.set_link_values("facebook", "https://facebook.com/robert")
+        person.set_link_values("wikipedia", "https://en.wikipedia.org/Bob")
+        assert person.facebook == "https://facebook.com/robert"
+        assert person.link_value("wikipedia") == \
+            "https://en.wikipedia.org/Bob"
+        person.del_link_values("facebook")
+        assert person.facebook is None
+        assert person.links == [
+            {"note": "wikipedia", "url": "https://en.wikipedia.org/Bob"}]
+        # changes made directly to the list
+        person.links.append({"note": "facebook", "url": "https://fb.com/b"})
+        assert person.facebook == "https://fb.com/b"
+        person.links = []
+        assert person.link_values("wikipedia") == []
+        person.wikidata = "Q1"
+        person.identifiers[0]["scheme"] = "not-wikidata"
+        person.data_changed("identifiers")
+        assert person.wikidata is None
+
+    def test_related_values_after_data_changed(self):
+        # long enough lists to be grouped rather than scanned
+        padding = [{"scheme": "s{0}".format(i), "identifier": str(i),
+                    "note": "n{0}".format(i), "url": str(i)}
+                   for i in range(RELATED_SCAN_LIMIT)]
+        person = Person(name="Bob", identifiers=[
+            {"scheme": "wikidata", "identifier": "Q1"}] + padding, links=[
+            {"note": "facebook", "url": "https://facebook.com/bob"}]
+            + padding)
+        assert person.wikidata == "Q1"
+        assert person.facebook == "https://facebook.com/bob"
+        person.identifiers.append({"scheme": "gss", "identifier": "E1"})
+        assert person.get_identifier("gss") == "E1"
+        person.set_identifier_values("gss", "E2")
+        assert person.get_identifier("gss") == "E2"
+        # entries replaced in place are seen after data_changed
+        person.identifiers[0] = {"scheme": "wikidata", "identifier": "Q2"}
+        person.data_changed("identifiers")
+        assert person.wikidata == "Q2"
+        person.data["links"][0] = {"note": "twitter", "url": "bob"}
+        person.data_changed("links")
+        assert person.facebook is None
+        assert person.twitter == "bob"
+        person.identifiers[0]["scheme"] = "isni"
+        person.data_changed("identifiers")
+        assert person.wikidata is None
+        assert person.get_identifier("isni") == "Q2"
+        person.del_link_values("twitter")
+        assert person.twitter is None
+        assert len(person.links) == RELATED_SCAN_LIMIT
+
+    def test_by_name(self):
+        popolo = Popolo({"persons": [
+            {"id": "1", "name": u"Paul l'Astnamé",
+             "sort_name": u"l'Astnamé, Paul"},
+            {"id": "2", "name": "Harry  TRUMAN",
+             "other_names": [{"name": "Harry S. Truman"}]},
+            {"id": "3", "name": "Harriet Truman", "given_name": "Harriet"},
+        ]})
+        persons = popolo.persons
+        assert persons.by_name("paul l'astname") == [persons[0]]
+        assert persons.by_name(u"L'ASTNAMÉ, PAUL") == [persons[0]]
+        assert persons.by_name("harry truman") == [persons[1]]
+        assert persons.by_name("Harry S. Truman") == [persons[1]]
+        assert persons.by_name("Truman") == []
+        assert persons.by_name_prefix("harr") == [persons[1], persons[2]]
+        assert persons.by_name_prefix("harry s") == [persons[1]]
+        assert persons.by_name_prefix("l'ast") == [persons[0]]
+
+    def test_by_name_follows_changes(self):
+        popolo = Popolo({"persons": [{"id": "1", "name": "Bob"}]})
+        bob = popolo.persons.first
+        assert popolo.persons.by_name("bob") == [bob]
+        bob.name = "Robert"
+        popolo.add(Person(id="2", name="Bobby"))
+        assert popolo.persons.by_name("bob") == []
+        assert popolo.persons.by_name_prefix("bob") == [popolo.persons[1]]
+        bob.absorb(Person(other_names=[{"name": "Bob"}]))
+        assert popolo.persons.by_name("bob") == [bob]
+        assert popolo.persons.by_name_prefix("ro") == [bob]
+
+    def test_name_index_built_at_once_matches_one_built_by_set(self):
+        names = [(0, ["Zoe", "zoe"]), (1, ["Anne", None, "Zoe"]),
+                 (2, []), (3, [u"Åsa", "Bob"])]
+        built = NameIndex.build(names)
+        incremental = NameIndex()
+        for position, held in names:
+            incremental.set(position, held)
+        assert built.sorted_keys == incremental.sorted_keys == \
+            ["anne", "asa", "bob", "zoe"]
+        assert built.buckets == incremental.buckets
+        assert built.keys == incremental.keys
+        built.set(2, ["Carl"])
+        assert built.sorted_keys == ["anne", "asa", "bob", "carl", "zoe"]
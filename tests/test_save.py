@@ -6,9 +6,10 @@ from datetime import datetime
 import json
 from approx_dates.models import ApproxDate
 from popolo_data.importer import Popolo, NotAValidType
+from popolo_data.matcher import FuzzyNameMatcher
 from popolo_data.models import (Person, Organization, Membership,
                                 Area, Post, Event)
-from popolo_data.base import approx_date_to_iso
+from popolo_data.base import approx_date_to_iso, approx_date_getter
 from tempfile import mktemp
 
 class TestSaving(TestCase):
@@ -28,6 +29,28 @@ class TestSaving(TestCase):
         assert approx_date_to_iso(p.birth_date) == "2015-06-23"        
         
     
+    def test_date_cache(self):
+        
+        p = Person(birth_date="1899-07")
+        first = p.birth_date
+        assert p.birth_date is first
+        assert approx_date_getter("1899-07") is first
+        p.birth_date = datetime(1899, 7, 1)
+        assert p.birth_date == datetime(1899, 7, 1).date()
+        p.data["birth_date"] = "1901"
+        assert approx_date_to_iso(p.birth_date) == "1901"
+        r = approx_date_getter("2015-06-23 to 2015-07-12")
+        assert approx_date_getter("2015-06-23 to 2015-07-12") is r
+    
+    def test_list_defaults_not_shared(self):
+        
+        p1 = Person()
+        p2 = Person()
+        p1.other_names.append({"name": "Dr Jones"})
+        assert p2.other_names == []
+        assert p1.other_names == [{"name": "Dr Jones"}]
+        assert p1.death_date is ApproxDate.FUTURE
+    
     def test_invalidtype(self):
         
         p = Popolo()
@@ -128,6 +151,192 @@ class TestSaving(TestCase):
         #test collection json export
         pop1.persons.json()
       
+    def test_merge_many(self):
+        
+        sources = [
+            {"persons": [{"id": "a1", "name": "Indiana Jones"},
+                         {"id": "a2", "name": "Marion Ravenwood"}],
+             "memberships": [{"person_id": "a1",
+                              "organization_id": "college"}]},
+            {"persons": [{"id": "b1", "name": "Indiana Jones",
+                          "gender": "male"}],
+             "memberships": [{"person_id": "b1",
+                              "organization_id": "college"}]},
+            {"persons": [{"id": "c1", "name": "Indiana Jones",
+                          "gender": "male", "email": "indy@madeup.com"},
+                         {"id": "c2", "name": "Sallah"}],
+             "memberships": [{"person_id": "c2",
+                              "organization_id": "cairo"}]},
+        ]
+        pops = [Popolo(x) for x in sources]
+        filename = mktemp(".json")
+        pops[2].to_filename(filename)
+        try:
+            merged = Popolo.merge_many([pops[0], pops[1], filename])
+        finally:
+            os.remove(filename)
+        
+        assert [p.id for p in merged.persons] == ["c1", "a2", "c2"]
+        assert [(m.person_id, m.organization_id)
+                for m in merged.memberships] == \
+            [("c1", "college"), ("c2", "cairo")]
+        #inputs are untouched
+        assert pops[0].memberships[0].person_id == "a1"
+        assert pops[1].persons[0].email is None
+        
+        pairwise = pops[0].merge(pops[1]).merge(pops[2])
+        assert pairwise.json_data == merged.json_data
+    
+    def test_merge_swapped_ids(self):
+
+        ours = Popolo({
+            "organizations": [{"id": "1", "name": "Labour"},
+                              {"id": "2", "name": "Green"}],
+            "memberships": [{"person_id": "p", "organization_id": "2"}]})
+        theirs = Popolo({
+            "organizations": [{"id": "3", "name": "Labour",
+                               "classification": "party"},
+                              {"id": "1", "name": "Green",
+                               "classification": "party"}]})
+        merged = ours.merge(theirs)
+        assert merged.merge_report.remap == {"1": "3", "2": "1"}
+        assert [(o.id, o.name) for o in merged.organizations] == \
+            [("3", "Labour"), ("1", "Green")]
+        assert merged.memberships[0].organization_id == "1"
+        assert merged.memberships[0].organization.name == "Green"
+        parallel = ours.merge(theirs, workers=2)
+        assert parallel.json_data == merged.json_data
+
+    def test_merge_report(self):
+        
+        ours = Popolo({"persons": [{"id": "a1", "name": "Indiana Jones"},
+                                   {"id": "a2", "name": "Sallah"}]})
+        theirs = Popolo({"persons": [{"id": "b1", "name": "Indiana Jones",
+                                      "gender": "male"}]})
+        merged = ours.merge(theirs)
+        report = merged.merge_report
+        assert ours.merge_report is None
+        assert [c.name for c in report.collections] == [
+            "organizations", "events", "persons", "areas", "posts",
+            "memberships"]
+        persons = report["persons"]
+        assert persons.unique_on == "name"
+        assert persons.input_counts == [2, 1]
+        assert persons.output_count == 2
+        assert [(c.key, c.winner, c.loser, c.keep_id, c.lose_id)
+                for c in persons.contested] == \
+            [("Indiana Jones", 1, 0, "b1", "a1")]
+        assert persons.wins() == [0, 1]
+        assert report.remap == {"a1": "b1"}
+        assert str(persons) == \
+            "merging persons on name: 2 + 1 = 2. 1 ids to change."
+        assert set(report.timings) == set(["load", "merge", "amend"])
+        assert set(persons.timings) >= set(["remap", "match", "absorb"])
+        json.dumps(report.as_dict())
+    
+    def test_information_content(self):
+        
+        p = Person(id="person1", name="Indiana Jones", email="",
+                   gender=None,
+                   other_names=[{"name": "Indy", "note": ""}])
+        assert p.information_content == 3
+        p.email = "indy@madeup.com"
+        assert p.information_content == 4
+        p.other_names.append({"name": "Junior"})
+        p.data_changed("other_names")
+        assert p.information_content == 5
+        p.absorb(Person(other_names=[{"name": "Henry Jones Jr."}]))
+        assert p.information_content == 6
+        assert Person(name="Indy") < p
+        assert p > Person(name="Indy")
+    
+    def test_merge_workers(self):
+
+        sources = [
+            {"organizations": [{"id": "o1", "name": "Marshall College"}],
+             "persons": [{"id": "a1", "name": "Indiana Jones"},
+                         {"id": "a2", "name": "Marion Ravenwood"}],
+             "posts": [{"id": "lecturer", "organization_id": "o1"}],
+             "memberships": [{"person_id": "a1", "organization_id": "o1",
+                              "post_id": "lecturer"}]},
+            {"organizations": [{"id": "m1", "name": "Marshall College",
+                                "classification": "university"}],
+             "persons": [{"id": "b1", "name": "Indiana Jones",
+                          "gender": "male"},
+                         {"id": "b2", "name": "Marion Ravenwod"}],
+             "events": [{"id": "e1", "organization_id": "o1"}],
+             "memberships": [{"person_id": "b1", "organization_id": "m1"},
+                             {"person_id": "b2", "organization_id": "m1"}]},
+        ]
+        ours, theirs = [Popolo(x) for x in sources]
+        serial = ours.merge(theirs)
+        parallel = ours.merge(theirs, workers=2)
+        assert parallel.json_data == serial.json_data
+        assert parallel.merge_report.remap == serial.merge_report.remap
+        for a, b in zip(parallel.merge_report.collections,
+                        serial.merge_report.collections):
+            a, b = a.as_dict(), b.as_dict()
+            a.pop("timings")
+            b.pop("timings")
+            assert a == b
+        assert [(m.person_id, m.organization_id)
+                for m in parallel.memberships] == \
+            [("b1", "m1"), ("b1", "m1"), ("b2", "m1")]
+        assert ours.persons[0].id == "a1"
+
+        unique_on = {"persons": FuzzyNameMatcher(0.8)}
+        assert ours.merge(theirs, unique_on=unique_on, workers=2) \
+            .json_data == ours.merge(theirs, unique_on=unique_on).json_data
+
+    def test_merge_dependencies(self):
+
+        dependencies = Popolo.merge_dependencies(Popolo(), {})
+        assert dependencies["organizations"] == []
+        assert dependencies["areas"] == []
+        assert dependencies["events"] == ["organizations"]
+        assert dependencies["memberships"] == [
+            "organizations", "persons", "areas"]
+        dependencies = Popolo.merge_dependencies(
+            Popolo(), {"organizations": "id"})
+        assert dependencies["events"] == []
+
+    def test_merge_prefer(self):
+        
+        ours = Popolo({"persons": [{"id": "a1", "name": "Indiana Jones"}]})
+        theirs = Popolo({"persons": [{"id": "b1", "name": "Indiana Jones",
+                                      "gender": "male"}]})
+        assert ours.merge(theirs).persons[0].id == "b1"
+        merged = ours.merge(theirs, prefer=lambda kept, other: False)
+        assert merged.persons[0].id == "a1"
+        assert merged.persons[0].gender == "male"
+        assert merged.merge_report["persons"].contested[0].winner == 0
+    
+    def test_adopt_does_not_copy(self):
+        
+        data = {"persons": [{"id": "person1", "name": "Indiana Jones"}]}
+        pop = Popolo.adopt(data)
+        assert pop.persons[0].data is data["persons"][0]
+        pop.persons[0].name = "Henry Jones"
+        assert data["persons"][0]["name"] == "Henry Jones"
+        copied = Popolo(data)
+        copied.persons[0].name = "Indiana Jones"
+        assert data["persons"][0]["name"] == "Henry Jones"
+
+    def test_shared_copy_is_copy_on_write(self):
+        
+        pop = Popolo({"persons": [{"id": "person1", "name": "Indiana Jones",
+                                   "other_names": []}]})
+        copied = pop.shared_copy()
+        original, person = pop.persons[0], copied.persons[0]
+        assert person.data is original.data
+        person.name = "Henry Jones"
+        person.other_names.append({"name": "Junior"})
+        assert person.data is not original.data
+        assert original.name == "Indiana Jones"
+        assert original.other_names == []
+        original.gender = "male"
+        assert person.gender is None
+
     def test_populate_from_scratch(self):
         """
         test person